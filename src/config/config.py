@@ -1,10 +1,12 @@
+from functools import lru_cache, cached_property
+from typing import Literal, Optional
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from sqlalchemy.orm import DeclarativeBase
-import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent  # На один уровень выше текущего файла
 ENV_PATH = BASE_DIR / ".env"
+DB_DIR = BASE_DIR / "database"  # Каталог для файла SQLite
 
 class DatabaseSettings(BaseSettings):
     DB_HOST: str = "postgres"
@@ -12,43 +14,65 @@ class DatabaseSettings(BaseSettings):
     POSTGRES_USER: str
     POSTGRES_PASSWORD: str
     POSTGRES_DB: str = "event_db"
+    # Пул соединений: под число одновременных задач бота (MAX_CONCURRENT_TASKS),
+    # в сумме не больше max_connections=50 из docker-compose
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 20
+    # Сколько соединений открыть заранее при старте бота
+    DB_POOL_MIN_SIZE: int = 5
+    # "queue" - пул соединений для бота, "null" - без пула для разовых скриптов
+    DB_POOL: str = "queue"
+    # Драйвер БД: PostgreSQL (asyncpg) или локальный SQLite (aiosqlite)
+    DB_DRIVER: Literal["asyncpg", "sqlite"] = "asyncpg"
 
 
     model_config = SettingsConfigDict(
         env_file=ENV_PATH, populate_by_name=True, extra="allow"
     )
 
-    @property
+    @cached_property
     def database_url_asyncpg(self):
         return f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.POSTGRES_DB}"
 
-    @property
+    @cached_property
     def database_url_psycopg(self):
         return f"postgresql+psycopg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.POSTGRES_DB}"
 
-    @property
+    @cached_property
     def database_url_sqlite(self):
-        base_dir = os.path.abspath(
-            os.path.join(os.path.dirname(__file__), '..'))  # поднимаемся на уровень выше текущего файла
-        db_path = os.path.join(base_dir, 'database', self.POSTGRES_DB)
-        return f"sqlite+aiosqlite:///{db_path}"
+        return f"sqlite+aiosqlite:///{DB_DIR / self.POSTGRES_DB}"
+
+    @cached_property
+    def database_url(self):
+        if self.DB_DRIVER == "sqlite":
+            return self.database_url_sqlite
+        return self.database_url_asyncpg
 
 
 class Settings(BaseSettings):
     app_name: str = "Telegram Reminder Bot"
-    database: DatabaseSettings = DatabaseSettings()
     BOT_TOKEN: str = "DEFAULT"
     SECRET_KEY: str = "DEFAULT"
     MAX_QUESTIONS: int = 10  # максимальное количество вопросов
+    BCRYPT_ROUNDS: int = 12  # стоимость bcrypt, подбирается через src/utils/tune_bcrypt.py
+    # Хранилище FSM: Redis (например, redis://redis:6379/0) или память процесса, если не задано
+    REDIS_URL: Optional[str] = None
+    FSM_TTL: int = 3600  # время жизни состояния и данных анкеты в Redis, секунд
 
     model_config = SettingsConfigDict(
         env_file=ENV_PATH, extra="allow"
     )
 
+    @cached_property
+    def database(self) -> DatabaseSettings:
+        # Настройки БД читаются только при первом обращении
+        return DatabaseSettings()
+
 
-settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Возвращает единственный экземпляр настроек (.env читается один раз)"""
+    return Settings()
 
 
-# Создаем базовый класс для моделей
-class Base(DeclarativeBase):
-    pass
+settings = get_settings()
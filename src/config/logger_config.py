@@ -1,6 +1,11 @@
 import logging
 import os
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from sys import stdout
+from time import monotonic
 
 from loguru import logger
 
@@ -18,23 +23,117 @@ log_file_path = os.path.join(log_dir, "async_app.log")
 # Очищаем предыдущие обработчики loguru
 logger.remove()
 
-# Лог в файл с ротацией и сжатием
-logger.add(
-    log_file_path,
-    level="INFO",
-    rotation="10 MB",  # Ротация при достижении 10 MB
-    compression="zip",  # Архивирование старых логов
-    enqueue=True,  # Асинхронная запись через очередь
-)
+# Архивирование выполняется в отдельном потоке, чтобы ротация не блокировала запись
+_compression_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-compress")
+
+
+def _zip_log_file(path: str):
+    with zipfile.ZipFile(f"{path}.zip", "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.write(path, os.path.basename(path))
+    os.remove(path)
+
+
+def compress_in_background(path: str):
+    _compression_executor.submit(_zip_log_file, path)
+
+
+class BatchingFileSink:
+    """Файловый sink, который копит записи и сбрасывает их на диск пачками.
+
+    Сброс происходит при накоплении batch_size записей, не реже раза в
+    flush_interval секунд и при остановке логгера. Ротация выполняется по
+    размеру файла, архивирование старых логов - в фоне.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        rotation_size: int = 10 * 1024 * 1024,
+        batch_size: int = 512,
+        flush_interval: float = 1.0,
+    ):
+        self._path = path
+        self._rotation_size = rotation_size
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._buffer: list[str] = []
+        self._lock = threading.Lock()
+        self._last_flush = monotonic()
+        self._file = open(path, "a", encoding="utf8")
+        self._stopped = threading.Event()
+        threading.Thread(
+            target=self._flush_periodically, name="log-flush", daemon=True
+        ).start()
+
+    def write(self, message: str):
+        with self._lock:
+            self._buffer.append(message)
+            if (
+                len(self._buffer) >= self._batch_size
+                or monotonic() - self._last_flush >= self._flush_interval
+            ):
+                self._flush()
+
+    def stop(self):
+        self._stopped.set()
+        with self._lock:
+            self._flush()
+            self._file.close()
+
+    def _flush(self):
+        self._last_flush = monotonic()
+        if not self._buffer:
+            return
+        self._file.write("".join(self._buffer))
+        self._file.flush()
+        self._buffer.clear()
+        if self._file.tell() >= self._rotation_size:
+            self._rotate()
+
+    def _rotate(self):
+        self._file.close()
+        root, ext = os.path.splitext(self._path)
+        rotated_path = f"{root}.{datetime.now():%Y-%m-%d_%H-%M-%S_%f}{ext}"
+        os.rename(self._path, rotated_path)
+        compress_in_background(rotated_path)
+        self._file = open(self._path, "a", encoding="utf8")
+
+    def _flush_periodically(self):
+        while not self._stopped.wait(self._flush_interval):
+            with self._lock:
+                if not self._file.closed:
+                    self._flush()
+
+
+# Минимальный уровень среди подключённых sink-ов: записи ниже него loguru всё равно отбросит
+min_level_no = logging.CRITICAL + 1
+
+
+def add_sink(sink, level: str, **kwargs) -> int:
+    """Подключает sink к loguru и обновляет min_level_no"""
+    global min_level_no
+    min_level_no = min(min_level_no, logger.level(level).no)
+    return logger.add(sink, level=level, **kwargs)
+
+
+# Лог в файл с ротацией (10 MB) и сжатием, запись пачками
+add_sink(BatchingFileSink(log_file_path), level="INFO")
 
 # Лог в консоль
-logger.add(stdout, level="INFO", colorize=True)
+add_sink(stdout, level="INFO", colorize=True)
+
+
+# Стандартные уровни logging, которые есть и в loguru.
+# Передаём имя, а не число: числовой уровень loguru выводит как "Level 20".
+LOGURU_LEVELS = frozenset(("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"))
 
 
 # Перенаправление стандартного logging в loguru
 class InterceptHandler(logging.Handler):
     def emit(self, record):
-        level = record.levelname
+        if record.levelno < min_level_no:
+            return  # не форматируем сообщение, которое ни один sink не запишет
+        level = record.levelname if record.levelname in LOGURU_LEVELS else record.levelno
         logger_opt = logger.opt(depth=6, exception=record.exc_info)
         logger_opt.log(level, record.getMessage())
 
@@ -46,7 +145,11 @@ sqlalchemy_loggers = [
     "sqlalchemy.dialects",
 ]
 
+# Обработчик не хранит состояния, поэтому один экземпляр используется всеми логгерами
+intercept_handler = InterceptHandler()
+
 for log_name in sqlalchemy_loggers:
-    logging.getLogger(log_name).handlers = [InterceptHandler()]
-    logging.getLogger(log_name).propagate = False
-    logging.getLogger(log_name).setLevel(logging.INFO)
+    sqlalchemy_logger = logging.getLogger(log_name)
+    sqlalchemy_logger.handlers = [intercept_handler]
+    sqlalchemy_logger.propagate = False
+    sqlalchemy_logger.setLevel(logging.INFO)
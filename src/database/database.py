@@ -1,51 +1,121 @@
 import asyncio
 from contextlib import asynccontextmanager
+from functools import lru_cache
 
 from sqlalchemy import text
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
-from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
 
-from src.config.config import settings
+from src.config.config import get_settings
 from src.config.logger_config import logger
 from src.database.models import Base
 
+settings = get_settings()
+
+
 # ---------------------------------------------------------
 # region engine
 # ---------------------------------------------------------
-engine = create_async_engine(
-    url=settings.database.database_url_asyncpg,
-    echo=False,  # Логирование SQL-запросов
-    poolclass=AsyncAdaptedQueuePool,
-    pool_size=10,
-    max_overflow=20,
-    pool_timeout=30,
-    pool_recycle=1800,
-)
+# Параметры подключения asyncpg: увеличенный кэш подготовленных запросов
+# (у asyncpg и у диалекта SQLAlchemy), отключённый JIT для коротких запросов бота
+# и TCP keepalive, чтобы простаивающие в пуле соединения не обрывались молча
+ASYNCPG_CONNECT_ARGS = {
+    "statement_cache_size": 1024,
+    "prepared_statement_cache_size": 1024,
+    "server_settings": {
+        "jit": "off",
+        "tcp_keepalives_idle": "30",
+        "tcp_keepalives_interval": "10",
+        "tcp_keepalives_count": "3",
+    },
+}
+
+
+@lru_cache(maxsize=1)
+def get_engine() -> AsyncEngine:
+    """Создаёт движок при первом обращении, а не при импорте модуля"""
+    connect_args = (
+        ASYNCPG_CONNECT_ARGS if settings.database.DB_DRIVER == "asyncpg" else {}
+    )
+    if settings.database.DB_POOL == "null":
+        # Разовые скрипты: соединение открывается на время запроса и сразу закрывается
+        return create_async_engine(
+            url=settings.database.database_url,
+            echo=False,
+            poolclass=NullPool,
+            connect_args=connect_args,
+        )
+    return create_async_engine(
+        url=settings.database.database_url,
+        echo=False,  # Логирование SQL-запросов
+        connect_args=connect_args,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=settings.database.DB_POOL_SIZE,
+        max_overflow=settings.database.DB_MAX_OVERFLOW,
+        pool_timeout=30,
+        pool_recycle=1800,
+        pool_pre_ping=True,  # Проверка соединения перед выдачей из пула
+    )
 # endregion
 # ---------------------------------------------------------
 
 
+_server_version = None
+
+
 # Пример использования базы данных в асинхронном режиме
 async def get_async_db_version():
-    async with engine.connect() as async_conn:
-        result = await async_conn.execute(text("SELECT VERSION()"))
-        logger.info(f"PostgresSQL version: {result.fetchone()[0]}")
+    """Версия сервера БД: для asyncpg берётся из параметров соединения без отдельного запроса"""
+    global _server_version
+    if _server_version is None:
+        async with get_engine().connect() as async_conn:
+            if settings.database.DB_DRIVER == "asyncpg":
+                raw_conn = await async_conn.get_raw_connection()
+                version = raw_conn.driver_connection.get_server_version()
+                _server_version = f"PostgreSQL {version.major}.{version.minor}"
+            else:
+                result = await async_conn.execute(text("SELECT sqlite_version()"))
+                _server_version = f"SQLite {result.scalar()}"
+    logger.info(f"Database version: {_server_version}")
+    return _server_version
 
 
 # Сессии для синхронного и асинхронного режима
-async_session = async_sessionmaker(engine, expire_on_commit=False)
+@lru_cache(maxsize=1)
+def get_sessionmaker() -> async_sessionmaker:
+    return async_sessionmaker(get_engine(), expire_on_commit=False)
+
+
+@lru_cache(maxsize=1)
+def get_read_sessionmaker() -> async_sessionmaker:
+    # Для чтения: без autoflush, чтобы запросы не вызывали промежуточный flush
+    return async_sessionmaker(get_engine(), expire_on_commit=False, autoflush=False)
 
 
 @asynccontextmanager
-async def get_db():
-    async with async_session() as session:
+async def get_db(readonly: bool = False):
+    factory = get_read_sessionmaker() if readonly else get_sessionmaker()
+    async with factory() as session:
         yield session
 
 
+async def warm_up_pool():
+    """Заранее открывает DB_POOL_MIN_SIZE соединений, чтобы первые обновления не ждали подключения"""
+    if settings.database.DB_POOL == "null":
+        return
+    engine = get_engine()
+    size = min(settings.database.DB_POOL_MIN_SIZE, settings.database.DB_POOL_SIZE)
+    connections = await asyncio.gather(*(engine.connect() for _ in range(size)))
+    # Закрытые соединения возвращаются в пул и остаются открытыми
+    await asyncio.gather(*(conn.close() for conn in connections))
+    logger.info(f"Пул соединений прогрет: {engine.pool.status()}")
+
+
 async def init_db():
-    async with engine.begin() as conn:
+    async with get_engine().begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
 
 if __name__ == "__main__":
+    settings.database.DB_POOL = "null"
     asyncio.run(get_async_db_version())
@@ -1,63 +1,87 @@
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from functools import lru_cache
 from datetime import datetime, UTC
 from typing import Sequence, Optional
 
-from cachetools import cached
+from cachetools.keys import hashkey
 from passlib.context import CryptContext
 from sqlalchemy import ForeignKey, String, DateTime, Text, Boolean
-from sqlalchemy import ForeignKeyConstraint, and_
-from sqlalchemy import select, exists
+from sqlalchemy import ForeignKeyConstraint, Index, and_
+from sqlalchemy import select, insert, update, delete, bindparam, literal, case
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import Mapped, mapped_column, relationship, selectinload, joinedload
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship, selectinload
 
-from src.config.config import Base
+from src.config.config import settings
 from src.config.logger_config import logger
-from src.utils.cache import events_cache, system_cache
+from src.utils.cache import (
+    events_cache,
+    system_cache,
+    settings_cache,
+    password_cache,
+    async_cached,
+    clear_event_cache,
+    ACTIVE_EVENTS_TAG,
+)
 
 
-@cached(cache=events_cache)
+@async_cached(events_cache, tag=int)
 async def get_cached_event_by_id(session, event_id):
     return await Event.get_event_by_id(session, event_id)
 
 
-@cached(cache=events_cache)
+@async_cached(events_cache, tag=lambda: ACTIVE_EVENTS_TAG)
 async def get_cached_active_events(session):
     return await Event.get_active_events(session)
 
 
-@cached(cache=events_cache)
+@async_cached(events_cache, tag=int)
 async def get_cached_questions(session, event_id):
     return await Question.get_questions(session, event_id)
 
 
-@cached(cache=events_cache)
+@async_cached(events_cache)
 async def check_admin_cached(session, user_id):
     return await User.check_admin(session, user_id)
 
 
 def clear_event_from_cache(event_id):
     """Очищает все записи в кеше, связанные с указанным event_id"""
-    keys_to_remove = []
-    for key in list(events_cache.keys()):
-        # Проверяем, содержит ли ключ наш event_id
-        if isinstance(key, tuple) and any(str(event_id) in str(k) for k in key):
-            keys_to_remove.append(key)
-
-    # Удаляем найденные ключи из кеша
-    for key in keys_to_remove:
-        if key in events_cache:
-            del events_cache[key]
+    clear_event_cache(event_id)
 
 
 def clear_all_cache():
     """Очищает весь кэш событий"""
-    events_cache.clear()
+    clear_event_cache()
+
+
+@lru_cache(maxsize=256)
+def format_event_date(event_date: datetime) -> str:
+    """Дата мероприятия в формате сообщений бота (кэшируется: дат немного, а форматируются часто)"""
+    return event_date.strftime("%d.%m.%Y в %H:%M")
+
+
+def dialect_insert(session: AsyncSession):
+    """Возвращает insert() диалекта сессии (нужен для ON CONFLICT)"""
+    return sqlite_insert if session.bind.dialect.name == "sqlite" else pg_insert
+
+
+# Создаем базовый класс для моделей
+class Base(DeclarativeBase):
+    pass
+
 
+# Ключ system_cache для множества ID администраторов
+ADMIN_IDS_CACHE_KEY = "admin_ids"
 
 pwd_context = CryptContext(
     schemes=["bcrypt"],
     deprecated="auto",
-    bcrypt__rounds=12,  # Можно настроить количество раундов
+    bcrypt__rounds=settings.BCRYPT_ROUNDS,  # Настраивается через BCRYPT_ROUNDS в .env
 )
 
 
@@ -103,6 +127,125 @@ class BroadcastQueue(Base):
         return False
 
 
+class NotificationQueue(Base):
+    """Персональные уведомления, которые фоновый обработчик рассылает по одному на пользователя"""
+
+    __tablename__ = "notification_queue"
+    __table_args__ = (Index("ix_notification_queue_status", "status", "id"),)
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    event_id: Mapped[Optional[int]] = mapped_column(nullable=True)
+    user_id: Mapped[int] = mapped_column()
+    text: Mapped[str] = mapped_column(Text)
+    reply_markup: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # JSON клавиатуры
+    status: Mapped[str] = mapped_column(String(16), default="pending")
+    attempts: Mapped[int] = mapped_column(default=0, server_default="0")
+
+    # После стольких неудачных отправок уведомление остаётся в таблице со статусом "failed"
+    MAX_ATTEMPTS = 3
+
+    @classmethod
+    async def enqueue(
+            cls,
+            session: AsyncSession,
+            user_ids: Sequence[int],
+            text: str,
+            reply_markup: Optional[str] = None,
+            event_id: Optional[int] = None,
+    ) -> int:
+        """Ставит уведомление в очередь для каждого пользователя одной вставкой"""
+        if not user_ids:
+            return 0
+        await session.execute(
+            insert(cls),
+            [
+                {
+                    "event_id": event_id,
+                    "user_id": user_id,
+                    "text": text,
+                    "reply_markup": reply_markup,
+                    "status": "pending",
+                }
+                for user_id in user_ids
+            ],
+        )
+        await session.commit()
+        return len(user_ids)
+
+    @classmethod
+    async def enqueue_registrants(cls, session: AsyncSession, event_id: int, text: str) -> int:
+        """Ставит уведомление в очередь всем участникам мероприятия (без commit).
+
+        INSERT ... SELECT выполняется на стороне БД: список участников не загружается в память.
+        """
+        result = await session.execute(
+            insert(cls).from_select(
+                ["event_id", "user_id", "text", "status"],
+                select(
+                    Registration.event_id,
+                    Registration.user_id,
+                    literal(text, Text),
+                    literal("pending", String(16)),
+                ).where(Registration.event_id == event_id),
+            )
+        )
+        return result.rowcount
+
+    @classmethod
+    async def claim_pending(
+            cls, session: AsyncSession, limit: int, after_id: int = 0
+    ) -> Sequence["NotificationQueue"]:
+        """Забирает пачку ожидающих уведомлений (с id больше after_id) и помечает их как отправляемые"""
+        result = await session.execute(
+            select(cls)
+            .where(cls.status == "pending", cls.id > after_id)
+            .order_by(cls.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        batch = result.scalars().all()
+        if batch:
+            await session.execute(
+                update(cls)
+                .where(cls.id.in_([item.id for item in batch]))
+                .values(status="sending")
+            )
+        await session.commit()
+        return batch
+
+    @classmethod
+    async def complete_batch(
+            cls, session: AsyncSession, sent_ids: Sequence[int], failed_ids: Sequence[int]
+    ):
+        """Удаляет доставленные уведомления, недоставленные возвращает в очередь.
+
+        После MAX_ATTEMPTS неудач уведомление остаётся в таблице со статусом "failed".
+        """
+        if sent_ids:
+            await session.execute(delete(cls).where(cls.id.in_(sent_ids)))
+        if failed_ids:
+            await session.execute(
+                update(cls)
+                .where(cls.id.in_(failed_ids))
+                .values(
+                    attempts=cls.attempts + 1,
+                    status=case(
+                        (cls.attempts + 1 >= cls.MAX_ATTEMPTS, "failed"), else_="pending"
+                    ),
+                )
+            )
+        await session.commit()
+
+    @classmethod
+    async def requeue_unfinished(cls, session: AsyncSession) -> int:
+        """Возвращает в очередь уведомления, прерванные перезапуском бота"""
+        result = await session.execute(
+            update(cls).where(cls.status == "sending").values(status="pending")
+        )
+        await session.commit()
+        return result.rowcount
+
+
 class SystemSetting(Base):
     __tablename__ = "system_settings"
 
@@ -113,10 +256,8 @@ class SystemSetting(Base):
     @classmethod
     async def get_setting(cls, session: AsyncSession, key: str, default=None):
         """Получить значение настройки по ключу"""
-        stmt = select(cls).where(cls.key == key)
-        result = await session.execute(stmt)
-        setting = result.scalars().first()
-        return setting.value if setting else default
+        value = await session.scalar(SETTING_VALUE_BY_KEY_STMT, {"key": key})
+        return default if value is None else value
 
     @classmethod
     async def set_setting(
@@ -126,46 +267,92 @@ class SystemSetting(Base):
         value: str,
         description: Optional[str] = None,
     ):
-        """Установить значение настройки"""
-        stmt = select(cls).where(cls.key == key)
-        result = await session.execute(stmt)
-        setting = result.scalars().first()
-
-        if setting:
-            setting.value = value
-            if description:
-                setting.description = description
-        else:
-            new_setting = cls(key=key, value=value, description=description)
-            session.add(new_setting)
-
+        """Установить значение настройки (один запрос INSERT ... ON CONFLICT DO UPDATE)"""
+        upsert = dialect_insert(session)
+        update_values = {"value": value}
+        if description:
+            update_values["description"] = description
+        stmt = (
+            upsert(cls)
+            .values(key=key, value=value, description=description)
+            .on_conflict_do_update(index_elements=[cls.key], set_=update_values)
+        )
+        await session.execute(stmt)
         await session.commit()
-        # Обновляем кэш, если настройка кэшируется
-        await cls.clear_setting_cache(key)
+        # Сразу кладём новое значение в кэш, чтобы следующее чтение не шло в базу
+        if value is not None:
+            settings_cache[f"setting:{key}"] = value
+        else:
+            await cls.clear_setting_cache(key)
         return True
 
     @classmethod
     async def get_setting_cached(cls, session: AsyncSession, key: str, default=None):
         """Получить значение настройки из кэша или из базы"""
         cache_key = f"setting:{key}"
-        cached_value = system_cache.get(cache_key)
+        cached_value = settings_cache.get(cache_key)
 
+        if isinstance(cached_value, asyncio.Future):
+            # Значение уже запрашивается другим обработчиком - ждём тот же запрос
+            value = await cached_value
+            return value if value is not None else default
         if cached_value is not None:
             return cached_value
 
-        value = await cls.get_setting(session, key, default)
-        if value is not None:
-            # Используем словарное присваивание вместо метода set
-            system_cache[cache_key] = value
-        return value
+        future = asyncio.get_running_loop().create_future()
+        settings_cache[cache_key] = future
+        try:
+            value = await cls.get_setting(session, key)
+        except Exception as e:
+            settings_cache.pop(cache_key, None)
+            future.set_exception(e)
+            future.exception()  # помечаем исключение как полученное
+            raise
+
+        if settings_cache.get(cache_key) is future:
+            if value is not None:
+                # Используем словарное присваивание вместо метода set
+                settings_cache[cache_key] = value
+            else:
+                settings_cache.pop(cache_key, None)
+        future.set_result(value)
+        return value if value is not None else default
+
+    @classmethod
+    async def get_settings_bulk(
+        cls, session: AsyncSession, keys: list[str], defaults: Optional[dict] = None
+    ) -> dict:
+        """Получить несколько настроек: из кэша, а недостающие - одним запросом"""
+        defaults = defaults or {}
+        values = {}
+        missing = []
+        for key in keys:
+            cached_value = settings_cache.get(f"setting:{key}")
+            if isinstance(cached_value, asyncio.Future):
+                cached_value = await cached_value
+            if cached_value is not None:
+                values[key] = cached_value
+            else:
+                missing.append(key)
+
+        if missing:
+            result = await session.execute(
+                select(cls.key, cls.value).where(cls.key.in_(missing))
+            )
+            for key, value in result:
+                if value is not None:
+                    settings_cache[f"setting:{key}"] = value
+                    values[key] = value
+
+        return {key: values.get(key, defaults.get(key)) for key in keys}
 
     @classmethod
     async def clear_setting_cache(cls, key: str):
         """Очистить кэш для конкретной настройки"""
         cache_key = f"setting:{key}"
         # Используем del вместо метода delete
-        if cache_key in system_cache:
-            del system_cache[cache_key]
+        if cache_key in settings_cache:
+            del settings_cache[cache_key]
 
 
 class User(Base):
@@ -178,14 +365,43 @@ class User(Base):
     password_hash: Mapped[str] = mapped_column(String(255), nullable=True)
     registrations: Mapped[list["Registration"]] = relationship(back_populates="user")
 
-    def verify_password(self, password: str):
-        """Проверяет, соответствует ли предоставленный пароль хешу пароля пользователя."""
-        return pwd_context.verify(password, self.password_hash)
+    @staticmethod
+    async def verify_password_hash(user_id: int, password_hash: Optional[str], password: str):
+        """Проверяет пароль по хешу без загрузки объекта User.
+
+        Результат кэшируется: хеш пароля входит в ключ, поэтому смена пароля
+        автоматически делает старые записи недействительными.
+        """
+        if not password_hash:
+            return False
+        cache_key = (
+            user_id,
+            hashlib.sha256(f"{password}{password_hash}".encode()).digest(),
+        )
+        cached_result = password_cache.get(cache_key)
+        if cached_result is not None:
+            return cached_result
+
+        # bcrypt выполняется в отдельном потоке, чтобы не блокировать event loop
+        is_valid = await asyncio.to_thread(pwd_context.verify, password, password_hash)
+        password_cache[cache_key] = is_valid
+        return is_valid
+
+    @classmethod
+    async def get_stored_password_hash(cls, session: AsyncSession, user_id: int) -> Optional[str]:
+        """Получает только хеш пароля пользователя, не загружая строку целиком."""
+        return await session.scalar(PASSWORD_HASH_BY_USER_STMT, {"user_id": user_id})
+
+    @staticmethod
+    def clear_password_cache(user_id: int):
+        """Удаляет из кэша результаты проверки паролей пользователя."""
+        for key in [key for key in list(password_cache.keys()) if key[0] == user_id]:
+            password_cache.pop(key, None)
 
     @staticmethod
-    def get_password_hash(password: str):
-        """Создает хеш для заданного пароля."""
-        return pwd_context.hash(password)
+    async def get_password_hash(password: str):
+        """Создает хеш для заданного пароля (в отдельном потоке)."""
+        return await asyncio.to_thread(pwd_context.hash, password)
 
     @classmethod
     async def get_all_users(cls, session: AsyncSession):
@@ -208,22 +424,28 @@ class User(Base):
         last_name: str,
         is_admin: bool = False,
     ):
-        """Добавляет нового пользователя или возвращает существующего."""
+        """Добавляет нового пользователя или возвращает существующего (один запрос UPSERT ... RETURNING)."""
         try:
-            user = await session.get(cls, user_id)
-            if not user:
-                user = cls(
-                    user_id=user_id,
-                    first_name=first_name,
-                    last_name=last_name,
-                    is_admin=is_admin,
-                )
-                session.add(user)
-                await session.commit()
-                logger.info(f"Добавлен новый пользователь (user_id={user_id})")
-            else:
-                logger.info(f"Пользователь уже существует (user_id={user_id})")
-            # Возвращаем пользователя в любом случае
+            upsert = dialect_insert(session)
+            stmt = upsert(cls).values(
+                user_id=user_id,
+                first_name=first_name,
+                last_name=last_name,
+                is_admin=is_admin,
+            )
+            # У существующего пользователя обновляются только имя и фамилия, права не трогаем
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[cls.user_id],
+                set_={
+                    "first_name": stmt.excluded.first_name,
+                    "last_name": stmt.excluded.last_name,
+                },
+            ).returning(cls)
+            user = await session.scalar(
+                stmt, execution_options={"populate_existing": True}
+            )
+            await session.commit()
+            logger.info(f"Пользователь добавлен или обновлён (user_id={user_id})")
             return user
 
         except SQLAlchemyError as e:
@@ -240,17 +462,18 @@ class User(Base):
             user = await session.get(cls, user_id)
             if user:
                 user.is_admin = True
-                user.password_hash = cls.get_password_hash(password)
+                user.password_hash = await cls.get_password_hash(password)
                 action = "Обновлены права пользователя до администратора"
             else:
                 user = cls(
                     user_id=user_id,
                     is_admin=True,
-                    password_hash=cls.get_password_hash(password),
+                    password_hash=await cls.get_password_hash(password),
                 )
                 session.add(user)
                 action = "Добавлен новый администратор"
             await session.commit()
+            cls.clear_admin_cache(user_id)
             logger.info(f"{action} (user_id={user_id})")
             return True
         except SQLAlchemyError as e:
@@ -260,11 +483,28 @@ class User(Base):
             )
             return False
 
+    @classmethod
+    async def get_admin_ids(cls, session: AsyncSession) -> frozenset[int]:
+        """Получает множество ID администраторов (кэшируется в system_cache)."""
+        admin_ids = system_cache.get(ADMIN_IDS_CACHE_KEY)
+        if admin_ids is None:
+            result = await session.scalars(select(cls.user_id).where(cls.is_admin == True))
+            admin_ids = frozenset(result.all())
+            system_cache[ADMIN_IDS_CACHE_KEY] = admin_ids
+        return admin_ids
+
+    @staticmethod
+    def clear_admin_cache(user_id: int):
+        """Сбрасывает закэшированные сведения о правах администратора."""
+        system_cache.pop(ADMIN_IDS_CACHE_KEY, None)
+        events_cache.pop(hashkey("check_admin_cached", user_id), None)
+
     @classmethod
     async def check_admin(cls, session: AsyncSession, user_id: int):
         """Проверяет, является ли пользователь администратором."""
-        user = await session.get(cls, user_id)
-        is_admin = user.is_admin if user else False
+        # Множество ID администраторов мало и кэшируется, поэтому обычные
+        # пользователи отсеиваются без отдельного запроса к базе
+        is_admin = user_id in await cls.get_admin_ids(session)
         logger.info(
             f"Проверка прав администратора (user_id={user_id}, is_admin={is_admin})"
         )
@@ -275,11 +515,14 @@ class User(Base):
         cls, session: AsyncSession, user_id: int, new_password: str
     ):
         """Обновляет пароль администратора."""
+        # bcrypt считается в потоке до чтения строки: транзакция не висит открытой на время хеширования
+        password_hash = await cls.get_password_hash(new_password)
         user = await session.get(cls, user_id)
         if user and user.is_admin:
             try:
-                user.password_hash = cls.get_password_hash(new_password)
+                user.password_hash = password_hash
                 await session.commit()
+                cls.clear_password_cache(user_id)
                 logger.info(f"Пароль администратора обновлен (user_id={user_id})")
                 return True
             except SQLAlchemyError as e:
@@ -327,6 +570,11 @@ class Event(Base):
         back_populates="event", cascade="all, delete-orphan"
     )
 
+    @property
+    def date_fmt(self) -> str:
+        """Дата мероприятия в формате сообщений бота."""
+        return format_event_date(self.event_date)
+
     @classmethod
     async def add_event(
         cls, session: AsyncSession, name: str, description: str, event_date: datetime
@@ -364,33 +612,24 @@ class Event(Base):
     async def get_active_events_with_questions_and_answers(cls, session: AsyncSession):
         """Возвращает активные мероприятия, у которых заданы вопросы и есть хотя бы один ответ."""
 
-        # Создаём подзапросы для проверки наличия вопросов и ответов.
-
-        # Подзапрос для проверки наличия вопросов
-        question_exists_subquery = exists(
-            select(Question.id).where(Question.event_id == cls.id)
-        )
-
-        # Подзапрос для проверки наличия ответов через Registration и Answer
-        answer_exists_subquery = exists(
-            select(Answer.id).where(Answer.registration_event_id == cls.id)
-        )
-
+        # Два независимых полусоединения: JOIN вопросов с ответами перемножил бы их строки
         result = await session.execute(
             select(cls)
-            .options(joinedload(cls.questions))
+            .options(selectinload(cls.questions))
             .where(
-                cls.status == "active", question_exists_subquery, answer_exists_subquery
+                cls.status == "active",
+                cls.id.in_(select(Question.event_id)),
+                cls.id.in_(select(Answer.registration_event_id)),
             )
         )
 
-        return result.unique().scalars().all()
+        return result.scalars().all()
 
     @classmethod
     async def get_event_by_id(cls, session: AsyncSession, event_id: int):
         """Получает мероприятие по его ID."""
         try:
-            result = await session.execute(select(cls).where(cls.id == event_id))
+            result = await session.execute(EVENT_BY_ID_STMT, {"event_id": event_id})
             event = result.scalar_one_or_none()
             if event:
                 logger.debug(f"Получено мероприятие (event_id={event_id})")
@@ -440,10 +679,13 @@ class Event(Base):
     ):
         """Устанавливает приветственное видео для мероприятия."""
         try:
-            event = await session.get(cls, event_id)
-            if event:
-                event.welcome_video_id = video_id
-                await session.commit()
+            result = await session.execute(
+                update(cls).where(cls.id == event_id).values(welcome_video_id=video_id)
+            )
+            await session.commit()
+            if result.rowcount == 1:
+                # Кэш сбрасывается сразу после фиксации транзакции и только при успешном обновлении
+                clear_event_cache(event_id)
                 logger.info(
                     f"Установлено приветственное видео для мероприятия (event_id={event_id}) video_id={video_id}"
                 )
@@ -481,22 +723,24 @@ class Event(Base):
 
     @classmethod
     async def update_reminder(
-        cls, session: AsyncSession, event_id: int, reminder_type: str, text: str
+        cls, session: AsyncSession, event_id: int, reminder_type: str, sent: bool = True
     ):
-        """Обновляет текст напоминания для мероприятия."""
+        """Обновляет флаг отправки напоминания для мероприятия."""
         try:
-            event = await cls.get_event_by_id(session, event_id)
-            if event:
-                setattr(event, f"reminder_{reminder_type}", text)
-                await session.commit()
+            result = await session.execute(
+                update(cls)
+                .where(cls.id == event_id)
+                .values({f"reminder_{reminder_type}": sent})
+            )
+            await session.commit()
+            if result.rowcount == 1:
                 logger.info(
                     f"Обновлено напоминание '{reminder_type}' для мероприятия (event_id={event_id})"
                 )
                 return True
-            else:
-                logger.warning(
-                    f"Не найдено мероприятие для обновления напоминания (event_id={event_id})"
-                )
+            logger.warning(
+                f"Не найдено мероприятие для обновления напоминания (event_id={event_id})"
+            )
         except SQLAlchemyError as e:
             await session.rollback()
             logger.exception(
@@ -513,6 +757,11 @@ class Registration(Base):
         DateTime(timezone=True), default=lambda: datetime.now(UTC)
     )
 
+    # Первичный ключ начинается с user_id, а выборки идут по event_id
+    __table_args__ = (
+        Index("ix_registrations_event_user", "event_id", "user_id"),
+    )
+
     user: Mapped["User"] = relationship(back_populates="registrations")
     event: Mapped["Event"] = relationship(back_populates="registrations")
     answers: Mapped[list["Answer"]] = relationship(
@@ -527,9 +776,7 @@ class Registration(Base):
         """Получает информацию о регистрациях на мероприятие."""
         try:
             result = await session.execute(
-                select(User.user_id, User.first_name, User.last_name)
-                .join(cls, cls.user_id == User.user_id)
-                .where(cls.event_id == event_id)
+                REGISTRATIONS_INFO_STMT, {"event_id": event_id}
             )
             registrations = result.all()
             logger.debug(
@@ -565,9 +812,9 @@ class Registration(Base):
         """Получает список ID пользователей, зарегистрированных на мероприятие."""
         try:
             result = await session.execute(
-                select(User.user_id).join(cls).where(cls.event_id == event_id)
+                REGISTERED_USERS_STMT, {"event_id": event_id}
             )
-            users = [row[0] for row in result.all()]
+            users = list(result.scalars().all())
             logger.debug(
                 f"Получены зарегистрированные пользователи для мероприятия (event_id={event_id}), всего {len(users)}"
             )
@@ -594,7 +841,7 @@ class Question(Base):
         """Получает все вопросы для мероприятия."""
         try:
             result = await session.execute(
-                select(cls).where(cls.event_id == event_id).order_by(cls.order)
+                QUESTIONS_BY_EVENT_STMT, {"event_id": event_id}
             )
             questions = result.scalars().all()
             logger.debug(
@@ -607,6 +854,20 @@ class Question(Base):
             )
             return []
 
+    @classmethod
+    async def add_questions(
+        cls, session: AsyncSession, event_id: int, question_texts: list[str]
+    ):
+        """Добавляет вопросы анкеты одним INSERT (executemany), без коммита."""
+        if question_texts:
+            await session.execute(
+                insert(cls),
+                [
+                    {"event_id": event_id, "question_text": text, "order": order}
+                    for order, text in enumerate(question_texts, start=1)
+                ],
+            )
+
     @classmethod
     async def update_question(
         cls, session: AsyncSession, question_id: int, new_text: str
@@ -631,6 +892,14 @@ class Question(Base):
         return False
 
 
+@dataclass
+class EventAnswers:
+    """Ответы на анкету мероприятия в разобранном виде."""
+
+    questions: dict[int, str]  # question_id -> текст, в порядке поля `order`
+    answers: Sequence[tuple[int, int, str]]  # (user_id, question_id, ответ), по user_id
+
+
 class Answer(Base):
     __tablename__ = "answers"
 
@@ -652,6 +921,8 @@ class Answer(Base):
             ["registration_user_id", "registration_event_id"],
             ["registrations.user_id", "registrations.event_id"],
         ),
+        # Выгрузка: ответы мероприятия сразу в порядке пользователей
+        Index("ix_answers_event_user", "registration_event_id", "registration_user_id"),
     )
 
     @classmethod
@@ -681,6 +952,32 @@ class Answer(Base):
             )
             return []
 
+    @classmethod
+    async def get_answers_table(cls, session: AsyncSession, event_id: int):
+        """Получает ответы для мероприятия двумя узкими запросами: вопросы
+        (в порядке поля `order`) и ответы, без повторения текстов в каждой строке."""
+        try:
+            questions_result = await session.execute(
+                select(Question.id, Question.question_text)
+                .where(Question.event_id == event_id)
+                .order_by(Question.order)
+            )
+            answers_result = await session.execute(
+                select(cls.registration_user_id, cls.question_id, cls.answer_text)
+                .where(cls.registration_event_id == event_id)
+                .order_by(cls.registration_user_id)
+            )
+            logger.debug(f"Получены ответы для мероприятия (event_id={event_id})")
+            return EventAnswers(
+                questions=dict(questions_result.all()),
+                answers=answers_result.all(),
+            )
+        except SQLAlchemyError as e:
+            logger.exception(
+                f"Ошибка получения ответов для мероприятия (event_id={event_id}): {str(e)}"
+            )
+            return EventAnswers(questions={}, answers=[])
+
     @classmethod
     async def get_answers_for_output(cls, session: AsyncSession, event_id: int):
         """Получает ответы для мероприятия в формате, удобном для вывода."""
@@ -704,3 +1001,35 @@ class Answer(Base):
             logger.exception(
                 f"Ошибка получения ответов для мероприятия (event_id={event_id}): {str(e)}"
             )
+
+
+# ---------------------------------------------------------
+# region Предсобранные запросы
+# ---------------------------------------------------------
+# Горячие запросы строятся один раз при импорте, при выполнении подставляются только параметры
+SETTING_VALUE_BY_KEY_STMT = select(SystemSetting.value).where(
+    SystemSetting.key == bindparam("key")
+)
+
+EVENT_BY_ID_STMT = select(Event).where(Event.id == bindparam("event_id"))
+
+PASSWORD_HASH_BY_USER_STMT = select(User.password_hash).where(
+    User.user_id == bindparam("user_id")
+)
+
+REGISTERED_USERS_STMT = select(Registration.user_id).where(
+    Registration.event_id == bindparam("event_id")
+)
+
+# Полусоединение: подзапрос по индексу (event_id, user_id), снаружи — поиск по PK users
+REGISTRATIONS_INFO_STMT = select(
+    User.user_id, User.first_name, User.last_name
+).where(User.user_id.in_(REGISTERED_USERS_STMT))
+
+QUESTIONS_BY_EVENT_STMT = (
+    select(Question)
+    .where(Question.event_id == bindparam("event_id"))
+    .order_by(Question.order)
+)
+# endregion
+# ---------------------------------------------------------
@@ -5,17 +5,19 @@ from aiogram import types, F, Router
 from aiogram.filters import Command, CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message, CallbackQuery
-from sqlalchemy import select
+from sqlalchemy import exists, insert, select
 
 from src.config.logger_config import logger
 from src.database.database import get_db
-from src.database.models import User, Event, Registration, Answer, Question, SystemSetting
+from src.database.models import User, Event, Registration, Answer, SystemSetting
 from src.database.models import (
     get_cached_event_by_id,
     get_cached_active_events,
     get_cached_questions,
 )
 from src.keyboards.keyboards import (
+    RegisterEventCallback,
+    ConfirmRegistrationCallback,
     get_registration_confirmation_kb,
     active_events_kb,
     events_keyboard,
@@ -27,10 +29,16 @@ from src.states.states import RegistrationForm
 router = Router()
 
 
-# Функции для получения настроек
-async def get_video_file_id():
-    async with get_db() as session:
-        return await SystemSetting.get_setting_cached(session, "VIDEO_FILE_ID", "")
+# Настройки, которые нужны обычному пользователю при /start
+START_SETTINGS_DEFAULTS = {"VIDEO_FILE_ID": "", "START_MESSAGE": ""}
+
+# Шаблон описания мероприятия
+EVENT_DESCRIPTION_TEMPLATE = (
+    "📌 <b>{name}</b>\n\n"
+    "📅 <b>Дата и время:</b> {date}\n\n"
+    "📝 <b>Описание:</b> <i>{description}</i>\n\n"
+    "<b>Хотите зарегистрироваться на это мероприятие?</b>"
+)
 
 
 # async def get_admin_commands_text():
@@ -40,25 +48,18 @@ async def get_video_file_id():
 #         )
 
 
-async def get_start_message():
-    async with get_db() as session:
-        return await SystemSetting.get_setting_cached(session, "START_MESSAGE", "")
-
+async def get_event_with_questions(event_id: int):
+    """Мероприятие и его вопросы (через кэш) в отдельной сессии для чтения"""
+    async with get_db(readonly=True) as session:
+        event = await get_cached_event_by_id(session, event_id)
+        questions = await get_cached_questions(session, event_id)
+    return event, questions
 
 
 def log_user_action(user_id: int, action: str, his: bool = False):
     logger.info(f"{"Пользователь" if not his else "Пользователю"}  {user_id} {action}")
 
 
-async def async_log_user_action(user_id: int, action: str, his: bool = False):
-    await asyncio.to_thread(
-        log_user_action,
-        user_id,
-        action,
-        his=his,
-    )
-
-
 # ---------------------------------------------------------
 # region Command("start")
 # ---------------------------------------------------------
@@ -66,7 +67,7 @@ async def async_log_user_action(user_id: int, action: str, his: bool = False):
 async def start(message: Message):
     user_id = message.from_user.id
     user_name = message.from_user.first_name
-    await async_log_user_action(user_id, "запустил команду /start", his=False)
+    log_user_action(user_id, "запустил команду /start", his=False)
 
     # Добавляем получение текущей даты и времени
     current_time = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
@@ -82,7 +83,12 @@ async def start(message: Message):
         )
 
         is_admin = user.is_admin  # Используем данные из полученного объекта
-        await async_log_user_action(
+        if not is_admin:
+            # Все настройки приветствия - одним запросом в той же сессии
+            start_settings = await SystemSetting.get_settings_bulk(
+                session, list(START_SETTINGS_DEFAULTS), START_SETTINGS_DEFAULTS
+            )
+        log_user_action(
             user_id,
             f"проверка админ-прав: {'администратор' if is_admin else 'обычный пользователь'}.",
             his=False,
@@ -95,7 +101,7 @@ async def start(message: Message):
         text += f"📅 Текущая дата и время: <b>{current_time}</b>\n\n"
         text += "Ваш статус - администратор!\n\nНажмите на кнопку [Команды] для доступа к меню.\n\n"
         await message.answer(text, parse_mode="HTML", reply_markup=admin_keyboard)
-        await async_log_user_action(
+        log_user_action(
             user_id,
             "показано приветственное сообщение со списком админ-команд.",
             his=True,
@@ -103,18 +109,15 @@ async def start(message: Message):
 
 
     else:
-        # Получаем ID видео из базы вместо использования константы
-        video_id = await get_video_file_id()
-
         await message.answer_video(
-            video=video_id,
+            video=start_settings["VIDEO_FILE_ID"],
             caption="",
         )
 
-        text += await get_start_message()
+        text += start_settings["START_MESSAGE"]
         await message.answer(text, parse_mode="HTML", reply_markup=events_keyboard)
         await offer_active_events(message)
-        await async_log_user_action(
+        log_user_action(
             user_id, "показано стандартное приветственное сообщение.", his=True
         )
 
@@ -122,7 +125,7 @@ async def start(message: Message):
 @router.message(Command("give_my_id"))
 async def give_my_id(message: Message):
     user_id = message.from_user.id
-    await async_log_user_action(
+    log_user_action(
         user_id, f"вызвал команду /give_my_id. Запрошен ID пользователя.", his=False
     )
     await message.answer(f"Ваш ID: {user_id}")
@@ -137,7 +140,7 @@ async def send_commands_inline(message: types.Message):
 @router.message(F.text.lower() == "мероприятия")
 async def handle_events_button(message: types.Message):
     await message.delete()
-    await async_log_user_action(
+    log_user_action(
         message.from_user.id, f"нажал кнопку: {message.text}", his=False
     )
     # Вызываем нужную функцию предложений мероприятий
@@ -146,33 +149,22 @@ async def handle_events_button(message: types.Message):
 
 async def offer_active_events(message: Message):
     """Функция предложит пользователю доступные мероприятия"""
-    user_id = message.from_user.id
-    await async_log_user_action(
-        user_id, "запросил список доступных мероприятий.", his=False
-    )
-
-    async with get_db() as session:
+    async with get_db(readonly=True) as session:
         events = await get_cached_active_events(session)
 
-        if events:
-            await message.answer(
-                "Доступные мероприятия для регистрации:",
-                reply_markup=active_events_kb(events),
-            )
-
-            await async_log_user_action(
-                user_id,
-                f"получил мероприятия для регистрации (всего: {len(events)}).",
-                his=False,
-            )
-        else:
-            await message.answer("В настоящее время нет активных мероприятий.")
+    if events:
+        await message.answer(
+            "Доступные мероприятия для регистрации:",
+            reply_markup=active_events_kb(events),
+        )
+    else:
+        await message.answer("В настоящее время нет активных мероприятий.")
 
-            await async_log_user_action(
-                user_id,
-                "получил сообщение об отсутствии активных мероприятий.",
-                his=False,
-            )
+    log_user_action(
+        message.from_user.id,
+        f"запросил список доступных мероприятий, показано: {len(events)}.",
+        his=False,
+    )
 
 
 # endregion
@@ -182,15 +174,17 @@ async def offer_active_events(message: Message):
 # ---------------------------------------------------------
 # region RegistrationForm(StatesGroup)
 # ---------------------------------------------------------
-async def ask_question(message: Message, state: FSMContext, questions, question_index):
+async def ask_question(message: Message, state: FSMContext, data: dict):
     """Функция задает вопрос или завершает регистрацию, если вопросы закончились"""
     user_id = message.from_user.id
-    if question_index < len(questions):
-        await state.update_data(current_question_index=question_index)
-        question_text = questions[question_index].question_text
+    question_texts = data["question_texts"]
+    # Номер следующего вопроса - это число уже полученных ответов
+    question_index = len(data["answers"])
+    if question_index < len(question_texts):
+        question_text = question_texts[question_index]
         await message.answer(question_text)
 
-        await async_log_user_action(
+        log_user_action(
             user_id,
             f"отправлен вопрос: '{question_text}' (индекс {question_index})",
             his=True,
@@ -198,39 +192,48 @@ async def ask_question(message: Message, state: FSMContext, questions, question_
         await state.set_state(RegistrationForm.DYNAMIC_QUESTION)
     else:
         # вопросы закончились, финализируем регистрацию
-        data = await state.get_data()
         event_id = data["event_id"]
 
-        await async_log_user_action(
+        log_user_action(
             user_id,
             "завершил ответы на вопросы, начинаем финализацию регистрации",
             his=False,
         )
         async with get_db() as session:
-            reg = Registration(user_id=user_id, event_id=event_id)
-            session.add(reg)
+            # Регистрация и все ответы - два INSERT, ответы одним executemany
+            await session.execute(
+                insert(Registration).values(user_id=user_id, event_id=event_id)
+            )
 
-            await async_log_user_action(
+            log_user_action(
                 user_id, f"сохранена Регистрация (Event ID: {event_id})", his=True
             )
             # Сохраняем ответы в БД
             answers = [
-                Answer(
-                    registration_user_id=reg.user_id,
-                    registration_event_id=reg.event_id,
-                    question_id=data["questions"][idx],
-                    answer_text=answer_text,
-                )
+                {
+                    "registration_user_id": user_id,
+                    "registration_event_id": event_id,
+                    "question_id": data["questions"][idx],
+                    "answer_text": answer_text,
+                }
                 for idx, answer_text in enumerate(data["answers"])
             ]
-            session.add_all(answers)
+            if answers:
+                await session.execute(insert(Answer), answers)
             await session.commit()
 
-            await async_log_user_action(
+            log_user_action(
                 user_id, f"добавлены Ответы в БД: {len(answers)}", his=True
             )
-            video_id = await Event.get_welcome_video(session, data["event_id"])
-            await message.answer("📌 Регистрация завершена!")
+            # Подтверждение отправляется в Telegram, пока из БД читается видео.
+            # TaskGroup дожидается обеих задач (сообщения приходят в прежнем порядке)
+            # и не теряет исключение ни одной из них
+            async with asyncio.TaskGroup() as tg:
+                tg.create_task(message.answer("📌 Регистрация завершена!"))
+                video_task = tg.create_task(
+                    Event.get_welcome_video(session, data["event_id"])
+                )
+        video_id = video_task.result()
 
         if video_id:
             await message.answer("Посмотрите вводное видео:")
@@ -240,7 +243,7 @@ async def ask_question(message: Message, state: FSMContext, questions, question_
                 caption="Спасибо за регистрацию!",
             )
 
-            await async_log_user_action(
+            log_user_action(
                 user_id, "отправлено приветственное видео после регистрации", his=True
             )
         else:
@@ -251,7 +254,7 @@ async def ask_question(message: Message, state: FSMContext, questions, question_
                 parse_mode="HTML",
             )
 
-            await async_log_user_action(
+            log_user_action(
                 user_id,
                 "отправлено уведомление о завершении регистрации (без видео)",
                 his=True,
@@ -261,12 +264,16 @@ async def ask_question(message: Message, state: FSMContext, questions, question_
 
 
 # старт динамической анкеты:
-@router.callback_query(lambda c: c.data.startswith("register_"))
-async def event_description(callback: types.CallbackQuery, state: FSMContext):
-    event_id = int(callback.data.split("_")[1])
+@router.callback_query(RegisterEventCallback.filter())
+async def event_description(
+    callback: types.CallbackQuery,
+    callback_data: RegisterEventCallback,
+    state: FSMContext,
+):
+    event_id = callback_data.event_id
     user_id = callback.from_user.id
 
-    await async_log_user_action(
+    log_user_action(
         user_id, f"запросил описание мероприятия с ID {event_id}", his=False
     )
     async with get_db() as session:
@@ -280,14 +287,12 @@ async def event_description(callback: types.CallbackQuery, state: FSMContext):
 
         await callback.answer(f"Описание мероприятия ID: {event_id}")
 
-        description = event.description
-        date = event.event_date.strftime("%d.%m.%Y в %H:%M")
-
-        text = (
-            f"📌 <b>{event.name}</b>\n\n"
-            f"📅 <b>Дата и время:</b> {date}\n\n"
-            f"📝 <b>Описание:</b> <i>{description}</i>\n\n"
-            "<b>Хотите зарегистрироваться на это мероприятие?</b>"
+        text = EVENT_DESCRIPTION_TEMPLATE.format_map(
+            {
+                "name": event.name,
+                "date": event.date_fmt,
+                "description": event.description,
+            }
         )
 
         await callback.message.edit_text(
@@ -296,15 +301,15 @@ async def event_description(callback: types.CallbackQuery, state: FSMContext):
             parse_mode="HTML",
         )
 
-        await async_log_user_action(
+        log_user_action(
             user_id, f"показано описание мероприятия с ID {event_id}", his=True
         )
 
 
-@router.callback_query(lambda c: c.data == "confirm_no")
+@router.callback_query(F.data == "confirm_no")
 async def confirm_no(callback: types.CallbackQuery):
     user_id = callback.from_user.id
-    await async_log_user_action(
+    log_user_action(
         user_id, f"отменил регистрацию на мероприятие", his=False
     )
 
@@ -317,7 +322,7 @@ async def confirm_no(callback: types.CallbackQuery):
                 reply_markup=active_events_kb(events),
             )
             await callback.answer("Выберите другое мероприятие.")
-            await async_log_user_action(
+            log_user_action(
                 user_id, f"снова показан список мероприятий.", his=True
             )
         else:
@@ -325,49 +330,58 @@ async def confirm_no(callback: types.CallbackQuery):
                 "В настоящее время нет активных мероприятий."
             )
             await callback.answer("Активных мероприятий нет.")
-            await async_log_user_action(
+            log_user_action(
                 user_id, f"сообщено о том, что мероприятий нет.", his=True
             )
 
 
-@router.callback_query(lambda c: c.data.startswith("confirm_yes_"))
-async def confirm_yes(callback: types.CallbackQuery, state: FSMContext):
-    event_id = int(callback.data.split("_")[2])
+@router.callback_query(ConfirmRegistrationCallback.filter())
+async def confirm_yes(
+    callback: types.CallbackQuery,
+    callback_data: ConfirmRegistrationCallback,
+    state: FSMContext,
+):
+    event_id = callback_data.event_id
     user_id = callback.from_user.id
-    await async_log_user_action(
+    log_user_action(
         user_id, f"подтвердил участие в мероприятии с ID {event_id}", his=False
     )
 
-    await callback.message.edit_text("Пожалуйста, ответьте на пару вопросов:")
-
-    await callback.answer(
-        f"Вы выбрали мероприятие ID: «{event_id}».\nПожалуйста, ответьте на несколько вопросов."
-    )
-
     async with get_db() as session:
-        existing_registration = await session.scalar(
-            select(Registration).where(
-                Registration.user_id == user_id, Registration.event_id == event_id
+        # Независимые чтения из БД выполняются одновременно
+        async with asyncio.TaskGroup() as tg:
+            registration_task = tg.create_task(
+                session.scalar(
+                    select(
+                        exists().where(
+                            Registration.user_id == user_id,
+                            Registration.event_id == event_id,
+                        )
+                    )
+                )
             )
-        )
-        event = await get_cached_event_by_id(session, event_id)
+            event_task = tg.create_task(get_event_with_questions(event_id))
+        existing_registration = registration_task.result()
+        event, questions = event_task.result()
         if existing_registration:
 
-            await async_log_user_action(
+            log_user_action(
                 user_id,
                 f"уже был ранее зарегистрирован на мероприятие «{event.name}» ID {event_id}",
                 his=False,
             )
 
-            await callback.message.edit_text(
-                f"✅ Вы уже зарегистрированы на мероприятие:\n\n"
-                f"«{event.name}»\n\n"
-                f"📅 Дата: {event.event_date.strftime('%d.%m.%Y в %H:%M')}\n"
+            # Сразу итоговый текст, без промежуточного "Пожалуйста, ответьте..."
+            await asyncio.gather(
+                callback.message.edit_text(
+                    f"✅ Вы уже зарегистрированы на мероприятие:\n\n"
+                    f"«{event.name}»\n\n"
+                    f"📅 Дата: {event.date_fmt}\n"
+                ),
+                callback.answer(),
             )
             return
 
-        questions = await Question.get_questions(session, event_id)
-
         # Проработка ситуации отсутствия вопросов
         if not questions:
             logger.warning(f"Отсутствуют вопросы анкеты для мероприятия ID {event_id}")
@@ -376,7 +390,7 @@ async def confirm_yes(callback: types.CallbackQuery, state: FSMContext):
             registration = Registration(event_id=event_id, user_id=user_id)
             session.add(registration)
             await session.commit()
-            await async_log_user_action(
+            log_user_action(
                 user_id,
                 f"успешно зарегистрирован на мероприятие ID {event_id} (без анкеты)",
                 his=False,
@@ -386,41 +400,45 @@ async def confirm_yes(callback: types.CallbackQuery, state: FSMContext):
             await callback.message.edit_text(
                 f"✅ Вы успешно зарегистрированы на мероприятие:\n\n"
                 f"«{event.name}»\n\n"
-                f"📅 Дата: {event.event_date.strftime('%d.%m.%Y в %H:%M')}\n"
+                f"📅 Дата: {event.date_fmt}\n"
             )
             await callback.answer("Вы успешно зарегистрированы!")
             return
 
         # Если вопросы есть — начинаем анкету
-        await state.update_data(
-            event_id=event_id, questions=[q.id for q in questions], answers=[]
+        # Тексты вопросов сохраняются в состоянии, чтобы не запрашивать их на каждый ответ
+        data = await state.update_data(
+            event_id=event_id,
+            questions=[q.id for q in questions],
+            question_texts=[q.question_text for q in questions],
+            answers=[],
         )
-        await async_log_user_action(
+        log_user_action(
             user_id,
             f"направлено начало анкеты из {len(questions)} вопросов для мероприятия ID {event_id}",
             his=True,
         )
 
-        await callback.answer(f"Анкета состоит из {len(questions)} вопросов")
-        await ask_question(callback.message, state, questions, 0)
+        await callback.message.edit_text("Пожалуйста, ответьте на пару вопросов:")
+        # На callback можно ответить только один раз, поэтому уведомление одно
+        await callback.answer(
+            f"Вы выбрали мероприятие ID: «{event_id}».\n"
+            f"Анкета состоит из {len(questions)} вопросов"
+        )
+        await ask_question(callback.message, state, data)
 
 
 # универсальный обработчик ответов на вопросы независимо от их количества:
 @router.message(RegistrationForm.DYNAMIC_QUESTION)
 async def handle_dynamic_question(message: Message, state: FSMContext):
     data = await state.get_data()
-    current_index = data.get("current_question_index", 0)
 
-    # добавляем текущий ответ в массив
-    answers = data.get("answers", [])
-    answers.append(message.text)
-    await state.update_data(answers=answers)
-
-    async with get_db() as session:
-        questions = await get_cached_questions(session, data["event_id"])
+    # добавляем текущий ответ в массив: одно чтение и одна запись состояния на ответ
+    data["answers"] = [*data.get("answers", []), message.text]
+    await state.set_data(data)
 
     # переходим к следующему вопросу или завершаем регистрацию
-    await ask_question(message, state, questions, current_index + 1)
+    await ask_question(message, state, data)
 
 
 # endregion
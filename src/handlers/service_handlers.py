@@ -1,9 +1,10 @@
+import asyncio
 import io
-from collections import defaultdict
-from datetime import datetime, UTC
-from typing import Union
+from datetime import date, datetime, UTC
+from types import MappingProxyType
+from typing import Callable, Final, Mapping, Union
 
-from openpyxl import Workbook
+import xlsxwriter
 
 from aiogram import Bot, types, F, Router
 from aiogram.exceptions import (
@@ -14,6 +15,7 @@ from aiogram.exceptions import (
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message
+from aiogram.utils.chat_action import ChatActionSender
 from aiogram_calendar.dialog_calendar import (
     DialogCalendarCallback,
     DialogCalendar,
@@ -22,7 +24,7 @@ from aiogram_calendar.dialog_calendar import (
 from src.config.config import settings
 from src.config.logger_config import logger
 from src.database.database import get_db
-from src.database.models import User, Event, Registration, Answer, Question, SystemSetting, BroadcastQueue
+from src.database.models import User, Event, Registration, Answer, Question, SystemSetting, BroadcastQueue, EventAnswers, NotificationQueue
 from src.database.models import (
     get_cached_event_by_id,
     get_cached_active_events,
@@ -33,9 +35,11 @@ from src.database.models import (
 )
 from src.keyboards.keyboards import (
     get_events_kb,
+    EventCallback,
     active_events_kb,
     get_broadcast_confirmation_kb,
     get_cancel_confirmation_kb,
+    CancelEventCallback,
     create_question_keyboard,
     create_time_keyboard,
     edit_setting_keyboard, get_reschedule_confirmation_kb
@@ -55,6 +59,7 @@ from src.states.states import (
     EditQuestions,
     AdminStates,
 )
+from src.utils.broadcast import send_with_retry
 from src.utils.scheduler import notify_admins
 
 router = Router()
@@ -70,34 +75,29 @@ async def reschedule_event(callback: types.CallbackQuery, state: FSMContext):
 
     logger.info(f"Админ {callback.from_user.id} начал процесс переноса мероприятия.")
 
-    async with get_db() as session:
+    async with get_db(readonly=True) as session:
         events = await get_cached_active_events(session)
 
-        if events:
-            await callback.message.answer(
-                "Выберите мероприятие, дату которого требуется перенести:",
-                reply_markup=get_events_kb(events)
-            )
-
-            await state.set_state(RescheduleEvent.choosing_event)
+    if events:
+        await callback.message.answer(
+            "Выберите мероприятие, дату которого требуется перенести:",
+            reply_markup=get_events_kb(events)
+        )
 
-            logger.info(
-                f"Отправлен список мероприятий админу {callback.from_user.id} для переноса."
-            )
-        else:
-            await callback.message.answer("🔴 Нет активных мероприятий.")
+        await state.set_state(RescheduleEvent.choosing_event)
 
+        logger.info(
+            f"Отправлен список мероприятий админу {callback.from_user.id} для переноса."
+        )
+    else:
+        await callback.message.answer("🔴 Нет активных мероприятий.")
 
-@router.callback_query(RescheduleEvent.choosing_event)
-async def process_event_selection(callback: types.CallbackQuery, state: FSMContext):
-    # Извлекаем ID из строки вида 'event_3'
-    event_id_str = callback.data.split('_')[1] if '_' in callback.data else callback.data
 
-    try:
-        event_id = int(event_id_str)
-    except ValueError:
-        await callback.message.answer("Ошибка: некорректный формат ID мероприятия.")
-        return
+@router.callback_query(RescheduleEvent.choosing_event, EventCallback.filter())
+async def process_event_selection(
+    callback: types.CallbackQuery, callback_data: EventCallback, state: FSMContext
+):
+    event_id = callback_data.event_id
 
     async with get_db() as session:
         event = await session.get(Event, event_id)
@@ -135,14 +135,18 @@ async def process_date_selection(
 
     # Если была нажата кнопка отмены
     if callback_data.act == DialogCalAct.cancel:
-        await state.clear()
-        await callback.message.edit_text("🚫 Перенос мероприятия отменен.")
-        await callback.answer("🚫 Перенос мероприятия отменен.", show_alert=True)
+        # Алерт, правка сообщения и сброс состояния не зависят друг от друга
+        await asyncio.gather(
+            state.clear(),
+            callback.message.edit_text("🚫 Перенос мероприятия отменен."),
+            callback.answer("🚫 Перенос мероприятия отменен.", show_alert=True),
+        )
         return
 
     if selected:
         if date_value:
-            await state.update_data(selected_date=date_value)
+            # В FSM только JSON-совместимые значения: дата хранится строкой ISO
+            await state.update_data(selected_date=date_value.date().isoformat())
 
             await callback.message.edit_text(
                 f"Вы выбрали дату: {date_value.strftime('%d.%m.%Y')}\nТеперь выберите время:",
@@ -162,7 +166,7 @@ async def process_date_selection(
 # Обработчик выбора времени
 @router.callback_query(F.data.startswith("time_"), RescheduleEvent.choosing_time)
 async def process_time_selection(callback: types.CallbackQuery, state: FSMContext):
-    time_str = callback.data.split("_")[1]
+    time_str = callback.data.removeprefix("time_")
     try:
         selected_time = datetime.strptime(time_str, "%H:%M").time()
     except ValueError:
@@ -170,11 +174,11 @@ async def process_time_selection(callback: types.CallbackQuery, state: FSMContex
         return
 
     data = await state.get_data()
-    selected_date = data["selected_date"]
+    selected_date = date.fromisoformat(data["selected_date"])
     full_datetime = datetime.combine(selected_date, selected_time)
     event_name = data["event_name"]
 
-    await state.update_data(new_date=full_datetime)
+    await state.update_data(new_date=full_datetime.isoformat())
 
     # Запрашиваем подтверждение перед изменением даты
     await callback.message.edit_text(
@@ -196,7 +200,7 @@ async def confirm_reschedule(callback: types.CallbackQuery, state: FSMContext, b
 
     data = await state.get_data()
     event_id = data["event_id"]
-    new_date = data["new_date"]
+    new_date = datetime.fromisoformat(data["new_date"])
     now = datetime.now()
     if new_date <= now:
         await callback.message.edit_text("Ошибка: нельзя перенести мероприятие на прошедшую дату.")
@@ -230,8 +234,8 @@ async def confirm_reschedule(callback: types.CallbackQuery, state: FSMContext, b
             f"с {old_date.strftime('%d.%m.%Y %H:%M')} на {new_date.strftime('%d.%m.%Y %H:%M')}"
         )
 
-        # Уведомляем зарегистрированных пользователей о переносе
-        await notify_users_about_reschedule(bot, event, old_date)
+    # Уведомляем зарегистрированных пользователей о переносе уже после закрытия сессии
+    await notify_users_about_reschedule(bot, event, old_date)
 
     await callback.message.edit_text(
         f"✅ Мероприятие успешно перенесено на {new_date.strftime('%d.%m.%Y %H:%M')}."
@@ -258,34 +262,34 @@ async def notify_users_about_reschedule(bot: Bot, event: Event, old_date: dateti
 Новая дата: 17.05.2025 13:00
 
 Ваша регистрация сохраняется. Будем рады встрече в вами."""
-    async with get_db() as session:
+    async with get_db(readonly=True) as session:
         # Получаем всех зарегистрированных пользователей с дополнительной информацией
         registrations = await Registration.get_registrations_info(session, event.id)
 
-        # Форматируем даты
-        old_date_str = old_date.strftime("%d.%m.%Y %H:%M")
-        new_date_str = event.event_date.strftime("%d.%m.%Y %H:%M")
-
-        # Отправляем уведомления всем зарегистрированным пользователям
-        for reg in registrations:
-            try:
-                # Используем имя пользователя в сообщении для большей персонализации
-                await bot.send_message(
-                    chat_id=reg.user_id,
-                    text=f"⚠️️ Сообщаем вам, {reg.first_name}, что у нас изменения в расписании.\n\n"
-                         f"Мероприятие '<b>{event.name}</b>' перенесено по техническим причинам.\n\n"
-                         f"📅 <b>Старая дата:</b> {old_date_str}\n\n"
-                         f"📆 <b>Новая дата:</b> {new_date_str}\n\n"
-                         f"Ваша регистрация сохраняется. Будем рады встрече в вами.",
-                    parse_mode="HTML"
-                )
-                logger.info(
-                    f"Отправлено уведомление о переносе мероприятия пользователю {reg.user_id} ({reg.first_name} {reg.last_name})")
-            except Exception as e:
-                logger.error(f"Ошибка при отправке уведомления пользователю {reg.user_id}: {e}")
-
-        # Логируем общую информацию
-        logger.info(f"Отправлены уведомления о переносе мероприятия '{event.name}' {len(registrations)} пользователям")
+    # Форматируем даты
+    old_date_str = old_date.strftime("%d.%m.%Y %H:%M")
+    new_date_str = event.event_date.strftime("%d.%m.%Y %H:%M")
+
+    # Отправляем уведомления всем зарегистрированным пользователям
+    for reg in registrations:
+        try:
+            # Используем имя пользователя в сообщении для большей персонализации
+            await bot.send_message(
+                chat_id=reg.user_id,
+                text=f"⚠️️ Сообщаем вам, {reg.first_name}, что у нас изменения в расписании.\n\n"
+                     f"Мероприятие '<b>{event.name}</b>' перенесено по техническим причинам.\n\n"
+                     f"📅 <b>Старая дата:</b> {old_date_str}\n\n"
+                     f"📆 <b>Новая дата:</b> {new_date_str}\n\n"
+                     f"Ваша регистрация сохраняется. Будем рады встрече в вами.",
+                parse_mode="HTML"
+            )
+            logger.info(
+                f"Отправлено уведомление о переносе мероприятия пользователю {reg.user_id} ({reg.first_name} {reg.last_name})")
+        except Exception as e:
+            logger.error(f"Ошибка при отправке уведомления пользователю {reg.user_id}: {e}")
+
+    # Логируем общую информацию
+    logger.info(f"Отправлены уведомления о переносе мероприятия '{event.name}' {len(registrations)} пользователям")
 
 
 # endregion
@@ -293,26 +297,31 @@ async def notify_users_about_reschedule(bot: Bot, event: Event, old_date: dateti
 
 
 
-async def notify_all_users(bot: Bot, event: Event):
-    async with get_db() as session:
-        users = await User.get_all_users(session)
-        events = await get_cached_active_events(session)
+async def notify_all_users(event: Event):
+    """Ставит уведомление о новом мероприятии в очередь: рассылку выполняет фоновый обработчик"""
+    # Независимые чтения идут параллельно в двух короткоживущих сессиях
+    async with get_db(readonly=True) as users_session, get_db(readonly=True) as events_session:
+        users, events = await asyncio.gather(
+            User.get_all_users(users_session), get_cached_active_events(events_session)
+        )
 
-    for user_id in users:
-        try:
-            await bot.send_message(
-                chat_id=user_id,
-                text=(
-                    f"⚠️ <b>Новое мероприятие:</b> {event.name}\n\n"
-                    f"<i>{event.description}</i>\n\n"
-                    f"📅 <b>Дата:</b> {event.event_date.strftime('%d.%m.%Y %H:%M')}\n\n"
-                    "👇🏼 Зарегистрируйтесь, чтобы принять участие! 👇🏼"
-                ),
-                parse_mode="HTML",
-                reply_markup=active_events_kb(events),
-            )
-        except Exception as e:
-            logger.error(f"Ошибка отправки уведомления пользователю {user_id}: {e}")
+    text = (
+        f"⚠️ <b>Новое мероприятие:</b> {event.name}\n\n"
+        f"<i>{event.description}</i>\n\n"
+        f"📅 <b>Дата:</b> {event.event_date.strftime('%d.%m.%Y %H:%M')}\n\n"
+        "👇🏼 Зарегистрируйтесь, чтобы принять участие! 👇🏼"
+    )
+    async with get_db() as session:
+        queued = await NotificationQueue.enqueue(
+            session,
+            users,
+            text,
+            reply_markup=active_events_kb(events).model_dump_json(exclude_none=True),
+            event_id=event.id,
+        )
+    logger.info(
+        f"Уведомление о мероприятии '{event.name}' поставлено в очередь для {queued} пользователей"
+    )
 
 
 # ---------------------------------------------------------
@@ -320,21 +329,8 @@ async def notify_all_users(bot: Bot, event: Event):
 # ---------------------------------------------------------
 # Обработка команд из callback-запросов
 async def handle_callback_command(command, callback, state):
-    commands_map = {
-        "broadcast": broadcast,
-        "add_event": add_event,
-        "reschedule_event": reschedule_event,
-        "cancel_event": cancel_event,
-        "edit_questions": edit_questions,
-        "set_welcome_video": set_welcome_video,
-        "export_answers": export_answers,
-        "view_registrations": view_registrations,
-        "add_admin": add_admin,
-        "change_password": change_password,
-        "edit_settings": edit_settings,
-    }
-
-    command_handler = commands_map.get(command)
+    # Таблица команд собирается один раз в конце модуля
+    command_handler = CALLBACK_COMMANDS.get(command)
     if command_handler:
         # Теперь передаём объект, похожий на CallbackQuery
         await command_handler(callback, state)
@@ -347,56 +343,50 @@ async def handle_callback_command(command, callback, state):
 
 @router.message(AdminAuth.password, F.text)
 async def check_admin_password(message: Message, state: FSMContext):
-    async with get_db() as session:
-        user = await session.get(User, message.from_user.id)
-
-        if user and user.verify_password(message.text):
-            data = await state.get_data()
-            original_callback = data.get("original_callback")
-
-            # Создаём фейковый объект CallbackQuery на основе сохранённых данных
-            if original_callback and original_callback.startswith("command_"):
-                # Формируем команду из callback data
-                command = original_callback.split("command_")[1]
-
-                # Создаём фейковый объект CallbackQuery
-                from aiogram.types import User as AiogramUser
-
-                class FakeCallbackQuery:
-                    def __init__(self, data_dict):
-                        self.data = original_callback
-                        self.message = message
-
-                        # Восстанавливаем объект from_user
-                        from_user_data = {
-                            "id": data_dict.get("callback_user_id"),
-                            "username": data_dict.get("callback_username"),
-                            "first_name": data_dict.get("callback_first_name"),
-                            "last_name": data_dict.get("callback_last_name"),
-                            "is_bot": False
-                        }
-                        self.from_user = AiogramUser(**{k: v for k, v in from_user_data.items() if v is not None})
-
-                    async def answer(self, text=None, show_alert=False):
-                        # Имитация метода answer
-                        pass
-
-                # Создаём фейковый объект для использования в обработчиках
-                fake_callback = FakeCallbackQuery(data)
-
-                # Теперь вызываем обработчик с фейковым CallbackQuery
-                await handle_callback_command(command, fake_callback, state)
-                try:
-                    await message.delete()  # Удаляем сообщение с паролем
-                except Exception as e:
-                    logger.warning(f"Не удалось удалить сообщение: {e}")
-
-                return
+    user_id = message.from_user.id
+    async with get_db(readonly=True) as session:
+        password_hash = await User.get_stored_password_hash(session, user_id)
 
-            await state.clear()
-        else:
-            await message.delete()  # Удаляем сообщение с паролем
-            await message.answer("❌ Неверный пароль! Попробуйте снова:")
+    if not await User.verify_password_hash(user_id, password_hash, message.text):
+        await message.delete()  # Удаляем сообщение с паролем
+        await message.answer("❌ Неверный пароль! Попробуйте снова:")
+        return
+
+    data = await state.get_data()
+    # Команда сохраняется без префикса ещё в AdminCallbackMiddleware
+    command = data.get("pending_command")
+    if not command:
+        await state.clear()
+        return
+
+    # Создаём фейковый объект CallbackQuery на основе сохранённых данных
+    from aiogram.types import User as AiogramUser
+
+    class FakeCallbackQuery:
+        def __init__(self, data_dict):
+            self.data = data_dict.get("original_callback")
+            self.message = message
+
+            # Восстанавливаем объект from_user
+            from_user_data = {
+                "id": data_dict.get("callback_user_id"),
+                "username": data_dict.get("callback_username"),
+                "first_name": data_dict.get("callback_first_name"),
+                "last_name": data_dict.get("callback_last_name"),
+                "is_bot": False
+            }
+            self.from_user = AiogramUser(**{k: v for k, v in from_user_data.items() if v is not None})
+
+        async def answer(self, text=None, show_alert=False):
+            # Имитация метода answer
+            pass
+
+    # Теперь вызываем обработчик с фейковым CallbackQuery
+    await handle_callback_command(command, FakeCallbackQuery(data), state)
+    try:
+        await message.delete()  # Удаляем сообщение с паролем
+    except Exception as e:
+        logger.warning(f"Не удалось удалить сообщение: {e}")
 
 
 
@@ -427,19 +417,21 @@ async def edit_settings(callback: types.CallbackQuery, state: FSMContext):
 
 @router.callback_query(F.data.startswith("edit_setting_"))
 async def begin_edit_setting(query: types.CallbackQuery, state: FSMContext):
-    setting_key = query.data.replace("edit_setting_", "")
+    setting_key = query.data.removeprefix("edit_setting_")
     user_id = query.from_user.id
-    async with get_db() as session:
+    # Проверка прав идёт по закэшированному множеству ID администраторов:
+    # соединение из пула берётся, только если нужно прочитать настройку
+    async with get_db(readonly=True) as session:
         admin = await check_admin_cached(session, user_id)
+        setting = await SystemSetting.get_setting(session, setting_key, "") if admin else None
 
     if not admin:
-        await query.message.delete()
-        await query.answer(f"🚫 У вас нет прав администратора.", show_alert=True)
+        await asyncio.gather(
+            query.message.delete(),
+            query.answer(f"🚫 У вас нет прав администратора.", show_alert=True),
+        )
         return
 
-    async with get_db() as session:
-        setting = await SystemSetting.get_setting(session, setting_key, "")
-
     await state.update_data(edit_setting_key=setting_key)
     await query.answer(f"Вы выбрали редактирование настройки '{setting_key}'")
     if setting_key == "VIDEO_FILE_ID" and setting:
@@ -568,14 +560,17 @@ async def process_date_selection(
     # Если была нажата кнопка отмены, метод process_selection вернет (False, None),
     # и при этом удалит клавиатуру с календарем
     if callback_data.act == DialogCalAct.cancel:
-        await state.clear()
-        await callback.message.edit_text("🚫 Создание мероприятия отменено.")
-        await callback.answer("🚫 Создание мероприятия отменено.", show_alert=True)
+        await asyncio.gather(
+            state.clear(),
+            callback.message.edit_text("🚫 Создание мероприятия отменено."),
+            callback.answer("🚫 Создание мероприятия отменено.", show_alert=True),
+        )
         return
 
     if selected:
         if date_value:
-            await state.update_data(selected_date=date_value)
+            # В FSM только JSON-совместимые значения: дата хранится строкой ISO
+            await state.update_data(selected_date=date_value.date().isoformat())
 
             await callback.message.edit_text(
                 f"Вы выбрали дату: {date_value.strftime('%d.%m.%Y')}\nТеперь выберите время:",
@@ -595,7 +590,7 @@ async def process_date_selection(
 # Обработчик выбора времени
 @router.callback_query(F.data.startswith("time_"), AddEvent.choosing_time)
 async def process_time_selection(callback: types.CallbackQuery, state: FSMContext):
-    time_str = callback.data.split("_")[1]
+    time_str = callback.data.removeprefix("time_")
     try:
         selected_time = datetime.strptime(time_str, "%H:%M").time()
     except ValueError:
@@ -603,9 +598,9 @@ async def process_time_selection(callback: types.CallbackQuery, state: FSMContex
         return
 
     data = await state.get_data()
-    selected_date = data["selected_date"]
+    selected_date = date.fromisoformat(data["selected_date"])
     full_datetime = datetime.combine(selected_date, selected_time)
-    await state.update_data(date=full_datetime)
+    await state.update_data(date=full_datetime.isoformat())
     logger.info(
         f"Админ {callback.from_user.id} установил дату мероприятия через inline-кнопки: {full_datetime.strftime('%Y-%m-%d %H:%M')}"
     )
@@ -620,29 +615,21 @@ async def process_time_selection(callback: types.CallbackQuery, state: FSMContex
 
 
 @router.message(AddEvent.question, Command("done"))
-async def finish_questions(message: Message, state: FSMContext, bot: Bot):
+async def finish_questions(message: Message, state: FSMContext):
     data = await state.get_data()
     async with get_db() as session:
         # Создание мероприятия
         event = await Event.add_event(
-            session, data["name"], data["description"], data["date"]
+            session, data["name"], data["description"], datetime.fromisoformat(data["date"])
         )
 
-        questions = data.get("questions", [])
-        # Добавляем вопросы без метода create
-        for order, question_text in enumerate(questions, start=1):
-            question = Question(
-                event_id=event.id,
-                question_text=question_text,
-                order=order,
-            )
-            session.add(question)
-
+        # Все вопросы - одним INSERT
+        await Question.add_questions(session, event.id, data.get("questions", []))
         await session.commit()
         clear_all_cache()
 
     # Уведомляем пользователей о новом мероприятии
-    await notify_all_users(bot, event)
+    await notify_all_users(event)
 
     # Сообщение админу
     await message.answer("Мероприятие и вопросы были успешно добавлены! ✅")
@@ -692,23 +679,25 @@ async def edit_questions(callback: types.CallbackQuery, state: FSMContext):
     await callback.answer()
 
     # Получаем список активных мероприятий из базы данных
-    async with get_db() as session:
+    async with get_db(readonly=True) as session:
         events = await get_cached_active_events(session)
 
-        # Отправляем сообщение с выбором мероприятия
-        await callback.message.answer(
-            "Выберите мероприятие:",
-            reply_markup=get_events_kb(events)
-        )
+    # Отправляем сообщение с выбором мероприятия
+    await callback.message.answer(
+        "Выберите мероприятие:",
+        reply_markup=get_events_kb(events)
+    )
 
-        # Устанавливаем состояние для FSM
-        await state.set_state(EditQuestions.EVENT)
+    # Устанавливаем состояние для FSM
+    await state.set_state(EditQuestions.EVENT)
 
 
 
-@router.callback_query(EditQuestions.EVENT, lambda c: c.data.startswith("event_"))
-async def select_question_to_edit(callback: types.CallbackQuery, state: FSMContext):
-    event_id = int(callback.data.split("_")[1])
+@router.callback_query(EditQuestions.EVENT, EventCallback.filter())
+async def select_question_to_edit(
+    callback: types.CallbackQuery, callback_data: EventCallback, state: FSMContext
+):
+    event_id = callback_data.event_id
     await callback.answer()
 
     async with get_db() as session:
@@ -745,13 +734,10 @@ async def finish_adding_questions_handler(message: Message, state: FSMContext):
 
     if questions:
         async with get_db() as session:
-            for order, question_text in enumerate(questions, 1):
-                session.add(
-                    Question(
-                        event_id=event_id, question_text=question_text, order=order
-                    )
-                )
+            await Question.add_questions(session, event_id, questions)
             await session.commit()
+        # Сбрасываем закэшированную анкету мероприятия
+        clear_event_from_cache(event_id)
 
         await message.answer(f"✅ Успешно добавлено {len(questions)} вопросов.")
         await state.clear()
@@ -792,7 +778,7 @@ async def add_question_handler(message: Message, state: FSMContext):
 
 @router.callback_query(EditQuestions.QUESTION)
 async def edit_question_text(callback: types.CallbackQuery, state: FSMContext):
-    question_id = int(callback.data.split("_")[1])
+    question_id = int(callback.data.removeprefix("question_"))
 
     # Получаем вопрос из БД через SQLAlchemy session.get()
     async with get_db() as session:
@@ -841,75 +827,97 @@ async def export_answers(callback: types.CallbackQuery, state: FSMContext):
 
     logger.info(f"Админ {callback.from_user.id} начал экспортирование ответов.")
 
-    async with get_db() as session:
+    async with get_db(readonly=True) as session:
         events = await Event.get_active_events_with_questions_and_answers(session)
 
-        if not events:
-            await callback.message.answer("Нет активных мероприятий с заданными вопросами.")
-            return
-
-        await state.set_state(ExportAnswers.event)  # устанавливаем состояние
-
-        await callback.message.answer(
-            "Выберите мероприятие:",
-            reply_markup=get_events_kb(events)
-        )
-
-        logger.info(
-            f"Отправлен список мероприятий админу {callback.from_user.id} для экспорта ответов."
-        )
+    if not events:
+        await callback.message.answer("Нет активных мероприятий с заданными вопросами.")
+        return
 
-@router.callback_query(ExportAnswers.event, lambda c: c.data.startswith("event_"))
-async def process_export(callback: types.CallbackQuery, state: FSMContext):
-    event_id = int(callback.data.split("_")[1])
+    await state.set_state(ExportAnswers.event)  # устанавливаем состояние
 
-    async with get_db() as session:
-        event = await get_cached_event_by_id(session, event_id)
-
-        # Получаем ответы с уже отсортированными вопросами
-        answers = await Answer.get_answers_for_event(session, event_id)
+    await callback.message.answer(
+        "Выберите мероприятие:",
+        reply_markup=get_events_kb(events)
+    )
 
-    # Группируем ответы по User ID
-    data = defaultdict(dict)
-    sorted_questions = []  # Список вопросов в нужном порядке
+    logger.info(
+        f"Отправлен список мероприятий админу {callback.from_user.id} для экспорта ответов."
+    )
 
-    for user_id, question_text, answer_text in answers:
-        data[user_id][question_text] = answer_text
-        if question_text not in sorted_questions:
-            sorted_questions.append(
-                question_text
-            )  # Добавляем вопросы в порядке их появления
+def build_answers_workbook(answers: EventAnswers) -> bytes:
+    """Собирает xlsx с ответами построчно: в режиме constant_memory в памяти только текущая строка"""
+    columns = {question_id: idx for idx, question_id in enumerate(answers.questions)}
 
-    # Создаем рабочую книгу и лист Excel
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Ответы"
+    buffer = io.BytesIO()
+    # Ответы пишутся как текст: без превращения "=..." в формулы и адресов в ссылки
+    workbook = xlsxwriter.Workbook(
+        buffer,
+        {"constant_memory": True, "strings_to_formulas": False, "strings_to_urls": False},
+    )
+    worksheet = workbook.add_worksheet("Ответы")
+
+    # Заголовки таблицы, затем строки с данными
+    worksheet.write_row(0, 0, ["User ID", *answers.questions.values()])
+
+    def write_user_row(row_num: int, user_id: int, row: list):
+        worksheet.write(row_num, 0, user_id)
+        worksheet.write_row(row_num, 1, row)
+
+    # Ответы приходят из БД отсортированными по user_id: строка пользователя
+    # записывается, как только начинаются ответы следующего
+    row_num, current_user, row = 0, None, None
+    for user_id, question_id, answer_text in answers.answers:
+        idx = columns.get(question_id)
+        if idx is None:
+            continue  # ответ на вопрос, которого уже нет в анкете
+        if user_id != current_user:
+            if row is not None:
+                row_num += 1
+                write_user_row(row_num, current_user, row)
+            current_user, row = user_id, [""] * len(columns)
+        row[idx] = answer_text
+    if row is not None:
+        write_user_row(row_num + 1, current_user, row)
+
+    workbook.close()
+    return buffer.getvalue()
+
+
+@router.callback_query(ExportAnswers.event, EventCallback.filter())
+async def process_export(
+    callback: types.CallbackQuery, callback_data: EventCallback, state: FSMContext, bot: Bot
+):
+    event_id = callback_data.event_id
 
-    # Заполняем заголовки таблицы
-    headers = ["User ID"] + sorted_questions
-    ws.append(headers)
+    async with get_db(readonly=True) as session:
+        event = await get_cached_event_by_id(session, event_id)
 
-    # Заполняем строки данными
-    for user_id, answers_dict in data.items():
-        row = [user_id] + [answers_dict.get(q, "") for q in sorted_questions]
-        ws.append(row)
+        # Вопросы (уже отсортированные) и ответы отдельными наборами
+        answers = await Answer.get_answers_table(session, event_id)
 
     try:
-        # Создаём Excel-файл в буфере памяти
-        excel_buffer = io.BytesIO()
-        wb.save(excel_buffer)
-        excel_buffer.seek(0)
-
-        excel_file = types.BufferedInputFile(
-            excel_buffer.getvalue(),
-            filename=f"анкеты_{event.event_date.strftime('%Y-%m-%d')}_{event.name}.xlsx",
-        )
+        # Пока файл собирается и загружается, админ видит статус "отправляет файл"
+        async with ChatActionSender.upload_document(bot=bot, chat_id=callback.message.chat.id):
+            # Сборка xlsx - чистая работа CPU: выполняется в потоке, не блокируя цикл событий
+            excel_bytes = await asyncio.to_thread(build_answers_workbook, answers)
+            excel_file = types.BufferedInputFile(
+                excel_bytes,
+                filename=f"анкеты_{event.event_date.strftime('%Y-%m-%d')}_{event.name}.xlsx",
+            )
 
-        await callback.answer(
-            f"🗃 Анкеты для мероприятия {event.event_date.strftime('%Y-%m-%d')} {event.name} были экспортированы в Excel."
-        )
-        await callback.message.edit_text("🗃 Файл Анкеты для мероприятия:")
-        await callback.message.answer_document(excel_file, caption="📄 Анкеты (Excel)")
+            await callback.answer(
+                f"🗃 Анкеты для мероприятия {event.event_date.strftime('%Y-%m-%d')} {event.name} были экспортированы в Excel."
+            )
+            await callback.message.edit_text("🗃 Файл Анкеты для мероприятия:")
+            # При TelegramRetryAfter загрузка повторяется после указанной паузы
+            sent = await send_with_retry(
+                lambda: callback.message.answer_document(excel_file, caption="📄 Анкеты (Excel)"),
+                callback.message.chat.id,
+            )
+
+        if not sent:
+            await callback.message.answer("Произошла ошибка при экспорте ответов.")
 
     except Exception as e:
         logger.exception(f"Ошибка во время экспорта ответов мероприятия {event_id}: {e}")
@@ -935,28 +943,30 @@ async def view_registrations(callback: types.CallbackQuery, state: FSMContext):
         f"Админ {callback.from_user.id} запросил просмотр регистраций мероприятий."
     )
 
-    async with get_db() as session:
+    async with get_db(readonly=True) as session:
         events = await get_cached_active_events(session)
 
-        if events:
-            await callback.message.answer(
-                "Выберите мероприятие:",
-                reply_markup=get_events_kb(events)
-            )
+    if events:
+        await callback.message.answer(
+            "Выберите мероприятие:",
+            reply_markup=get_events_kb(events)
+        )
 
-            await state.set_state(ViewRegistrations.event)
+        await state.set_state(ViewRegistrations.event)
 
-            logger.info(
-                f"Отправлен список мероприятий админу {callback.from_user.id} для просмотра регистраций."
-            )
-        else:
-            await callback.message.answer("Нет активных мероприятий.")
+        logger.info(
+            f"Отправлен список мероприятий админу {callback.from_user.id} для просмотра регистраций."
+        )
+    else:
+        await callback.message.answer("Нет активных мероприятий.")
 
 
 
-@router.callback_query(ViewRegistrations.event, lambda c: c.data.startswith("event_"))
-async def show_registrations(callback: types.CallbackQuery, state: FSMContext):
-    event_id = int(callback.data.split("_")[1])
+@router.callback_query(ViewRegistrations.event, EventCallback.filter())
+async def show_registrations(
+    callback: types.CallbackQuery, callback_data: EventCallback, state: FSMContext
+):
+    event_id = callback_data.event_id
     await callback.answer(
         f"Админ {callback.from_user.id} выбрал мероприятие {event_id}"
     )
@@ -1062,15 +1072,16 @@ async def change_password(callback: types.CallbackQuery, state: FSMContext):
 
 @router.message(ChangePassword.old_password)
 async def process_old_password(message: Message, state: FSMContext):
-    async with get_db() as session:
-        user = await session.get(User, message.from_user.id)
-        if user and user.verify_password(message.text):
-            await state.update_data(old_password=message.text)
-            await message.answer("Введите новый пароль:")
-            await state.set_state(ChangePassword.new_password)
-        else:
-            await message.answer("Неверный пароль!")
-            await state.clear()
+    user_id = message.from_user.id
+    async with get_db(readonly=True) as session:
+        password_hash = await User.get_stored_password_hash(session, user_id)
+
+    if await User.verify_password_hash(user_id, password_hash, message.text):
+        await message.answer("Введите новый пароль:")
+        await state.set_state(ChangePassword.new_password)
+    else:
+        await message.answer("Неверный пароль!")
+        await state.clear()
 
 
 @router.message(ChangePassword.new_password)
@@ -1115,9 +1126,11 @@ async def cancel_event(callback: types.CallbackQuery, state: FSMContext):
 
 
 
-@router.callback_query(CancelEvent.event, lambda c: c.data.startswith("event_"))
-async def select_event_to_cancel(callback: types.CallbackQuery, state: FSMContext):
-    event_id = int(callback.data.split("_")[1])
+@router.callback_query(CancelEvent.event, EventCallback.filter())
+async def select_event_to_cancel(
+    callback: types.CallbackQuery, callback_data: EventCallback, state: FSMContext
+):
+    event_id = callback_data.event_id
     await callback.answer(
         f"Админ {callback.from_user.id} выбрал мероприятие {event_id}"
     )
@@ -1129,59 +1142,58 @@ async def select_event_to_cancel(callback: types.CallbackQuery, state: FSMContex
     await state.set_state(CancelEvent.confirmation)
 
 
-@router.callback_query(CancelEvent.confirmation)
+@router.callback_query(CancelEvent.confirmation, CancelEventCallback.filter())
 async def confirm_cancellation(
-    callback: types.CallbackQuery, state: FSMContext, bot: Bot
+    callback: types.CallbackQuery,
+    callback_data: CancelEventCallback,
+    state: FSMContext,
+    bot: Bot,
 ):
-    if callback.data.startswith("cancel_confirm_"):
-        event_id = int(callback.data.split("_")[2])
-        await callback.answer(
-            f"Админ {callback.from_user.id} отменил мероприятие {event_id}"
+    event_id = callback_data.event_id
+    await callback.answer(
+        f"Админ {callback.from_user.id} отменил мероприятие {event_id}"
+    )
+    async with get_db() as session:
+        event = await Event.get_event_by_id(session, event_id)
+        if event is None:
+            await callback.message.answer("Ошибка при отмене мероприятия.")
+            await state.clear()
+            return
+
+        # Уведомляем администраторов с помощью функции notify_admins
+        await notify_admins(bot, event)
+
+        # Текст одинаков для всех, поэтому форматируется один раз
+        text = (
+            f"<b>Мероприятие:</b> {event.name} ❌\n\n"
+            f"<b>Дата:</b> {event.event_date.strftime('%d.%m.%Y')}\n\n"
+            f"⚠️ <b>Обратите, пожалуйста, внимание, что это событие было отменено. Актуальную информацию об этом и других мероприятиях вы сможете получить в нашем боте.\nНа связи</b> ⚠️\n"
         )
-        async with get_db() as session:
-            # Получаем список пользователей перед удалением
-            registrations = await Registration.get_registrations_info(session, event_id)
-            users = [reg.user_id for reg in registrations]
-
-            # Получаем информацию о мероприятии (нужно для уведомления админов)
-            event = await get_cached_event_by_id(session, event_id)
-
-            # Уведомляем администраторов с помощью функции notify_admins
-            await notify_admins(bot, event)
-
-            # Удаляем мероприятие
-            success = await Event.cancel_event(session, event_id)
-            # Очищаем кэш для этого мероприятия
-            clear_event_from_cache(event_id)
-            """Мероприятие: Тест
-
-Дата: 23.05.2025
-
-⚠️ Обратите, пожалуйста, внимание, что это событие было отменено. Актуальную информацию об этом и других мероприятиях вы сможете получить в нашем боте. 
-На связи ⚠️"""
-            if success:
-                await callback.message.edit_text("Мероприятие успешно отменено!")
-                # Отправляем уведомления зарегистрированным пользователям
-                for user_id in users:
-                    try:
-                        await bot.send_message(
-                            user_id,
-                            f"<b>Мероприятие:</b> {event.name} ❌\n\n"
-                            f"<b>Дата:</b> {event.event_date.strftime('%d.%m.%Y')}\n\n"
-                            f"⚠️ <b>Обратите, пожалуйста, внимание, что это событие было отменено. Актуальную информацию об этом и других мероприятиях вы сможете получить в нашем боте.\nНа связи</b> ⚠️\n",
-                            parse_mode="HTML",
-                        )
-                    except Exception as e:
-                        logger.exception(
-                            f"Ошибка отправки уведомления об отмене мероприятия пользователю {user_id}: {e}"
-                        )
-
-            else:
-                await callback.message.answer("Ошибка при отмене мероприятия.")
+        # Уведомления участникам ставятся в очередь INSERT ... SELECT до удаления регистраций
+        # и фиксируются одним commit вместе с отменой: рассылку выполняет фоновый обработчик
+        queued = await NotificationQueue.enqueue_registrants(session, event_id, text)
+
+        # Удаляем мероприятие
+        success = await Event.cancel_event(session, event_id)
+        # Очищаем кэш для этого мероприятия
+        clear_event_from_cache(event_id)
+
+    if success:
+        logger.info(
+            f"Уведомление об отмене мероприятия {event_id} поставлено в очередь для {queued} пользователей"
+        )
+        await callback.message.edit_text("Мероприятие успешно отменено!")
     else:
-        await callback.answer("Отмена мероприятия отклонена.")
-        await callback.message.edit_text("Отмена мероприятия отклонена.")
+        await callback.message.answer("Ошибка при отмене мероприятия.")
+
+    await state.clear()
+
 
+# Любая другая кнопка на шаге подтверждения - отказ от отмены
+@router.callback_query(CancelEvent.confirmation)
+async def reject_cancellation(callback: types.CallbackQuery, state: FSMContext):
+    await callback.answer("Отмена мероприятия отклонена.")
+    await callback.message.edit_text("Отмена мероприятия отклонена.")
     await state.clear()
 
 
@@ -1213,27 +1225,17 @@ async def broadcast(callback: types.CallbackQuery, state: FSMContext):
 # Обработчик ввода сообщения
 @router.message(BroadcastMessage.message)
 async def process_broadcast_message(message: Message, state: FSMContext):
-    msg_data = {}
-
+    # file_id сохраняется под общим ключом media_id, подпись или текст - под ключом text
     if message.photo:
-        msg_data["photo"] = message.photo[-1].file_id
-        msg_data["caption"] = message.html_text or ""
-        msg_data["type"] = "photo"
+        msg_data = {"type": "photo", "media_id": message.photo[-1].file_id}
     elif message.voice:
-        msg_data["voice"] = message.voice.file_id
-        msg_data["caption"] = message.html_text or ""
-        msg_data["type"] = "voice"
+        msg_data = {"type": "voice", "media_id": message.voice.file_id}
     elif message.video_note:
-        msg_data["video_note"] = message.video_note.file_id
-        msg_data["caption"] = ""  # кружочки не поддерживают подписи
-        msg_data["type"] = "video_note"
+        msg_data = {"type": "video_note", "media_id": message.video_note.file_id}
     elif message.video:
-        msg_data["video"] = message.video.file_id
-        msg_data["caption"] = message.html_text or ""
-        msg_data["type"] = "video"
+        msg_data = {"type": "video", "media_id": message.video.file_id}
     elif message.text:
-        msg_data["text"] = message.html_text
-        msg_data["type"] = "text"
+        msg_data = {"type": "text", "media_id": None}
     else:
         await message.answer(
             "❌ Этот тип сообщения не поддерживается."
@@ -1241,6 +1243,9 @@ async def process_broadcast_message(message: Message, state: FSMContext):
         )
         return
 
+    # Кружочки не поддерживают подписи
+    msg_data["text"] = None if message.video_note else (message.html_text or "")
+
     await state.update_data(msg_data=msg_data)
 
     await message.answer(
@@ -1266,40 +1271,12 @@ async def confirm_broadcast(callback: types.CallbackQuery, state: FSMContext, bo
     logger.info(f"Админ {callback.from_user.id} добавил в очередь рассылку типа '{msg_data['type']}'")
 
     async with get_db() as session:
-        # Подготовка данных для сохранения в БД
-        if msg_data["type"] == "text":
-            await BroadcastQueue.add_to_queue(
-                session,
-                text=msg_data["text"],
-                media_type="text"
-            )
-        elif msg_data["type"] == "photo":
-            await BroadcastQueue.add_to_queue(
-                session,
-                text=msg_data["caption"],
-                media_id=msg_data["photo"],
-                media_type="photo"
-            )
-        elif msg_data["type"] == "voice":
-            await BroadcastQueue.add_to_queue(
-                session,
-                text=msg_data["caption"],
-                media_id=msg_data["voice"],
-                media_type="voice"
-            )
-        elif msg_data["type"] == "video_note":
-            await BroadcastQueue.add_to_queue(
-                session,
-                media_id=msg_data["video_note"],
-                media_type="video_note"
-            )
-        elif msg_data["type"] == "video":
-            await BroadcastQueue.add_to_queue(
-                session,
-                text=msg_data["caption"],
-                media_id=msg_data["video"],
-                media_type="video"
-            )
+        await BroadcastQueue.add_to_queue(
+            session,
+            text=msg_data["text"],
+            media_id=msg_data["media_id"],
+            media_type=msg_data["type"],
+        )
 
     await callback.message.answer(
         "Сообщение успешно добавлено в очередь рассылки. "
@@ -1334,12 +1311,15 @@ async def set_welcome_video(callback: types.CallbackQuery, state: FSMContext):
         await state.set_state(SetWelcomeVideo.SELECT_EVENT)
 
 
-@router.callback_query(SetWelcomeVideo.SELECT_EVENT, lambda c: c.data.startswith("event_"))
-async def select_event_for_video(callback: types.CallbackQuery, state: FSMContext):
-    event_id = int(callback.data.split("_")[1])
+@router.callback_query(SetWelcomeVideo.SELECT_EVENT, EventCallback.filter())
+async def select_event_for_video(
+    callback: types.CallbackQuery, callback_data: EventCallback, state: FSMContext
+):
+    event_id = callback_data.event_id
     await callback.answer(f"Выбрано мероприятие {event_id}")
-    async with get_db() as session:
-        event = await session.get(Event, event_id)
+    # Мероприятие берётся из кэша: set_welcome_video сбрасывает его после обновления видео
+    async with get_db(readonly=True) as session:
+        event = await get_cached_event_by_id(session, event_id)
     await callback.message.delete()
     if event and event.welcome_video_id:
         await callback.message.answer_video(
@@ -1388,9 +1368,8 @@ async def save_media(message: Message, state: FSMContext):
     data = await state.get_data()
 
     async with get_db() as session:
+        # Кэш мероприятия сбрасывается внутри set_welcome_video после commit
         success = await Event.set_welcome_video(session, data["event_id"], media_id)
-        # Очищаем кэш для этого мероприятия
-        clear_event_from_cache(data["event_id"])
 
     await message.delete()
     if success:
@@ -1403,3 +1382,26 @@ async def save_media(message: Message, state: FSMContext):
 
 # endregion
 # ---------------------------------------------------------
+
+
+# ---------------------------------------------------------
+# region Таблица callback-команд
+# ---------------------------------------------------------
+# Строится один раз при импорте, после объявления всех обработчиков
+CALLBACK_COMMANDS: Final[Mapping[str, Callable]] = MappingProxyType(
+    {
+        "broadcast": broadcast,
+        "add_event": add_event,
+        "reschedule_event": reschedule_event,
+        "cancel_event": cancel_event,
+        "edit_questions": edit_questions,
+        "set_welcome_video": set_welcome_video,
+        "export_answers": export_answers,
+        "view_registrations": view_registrations,
+        "add_admin": add_admin,
+        "change_password": change_password,
+        "edit_settings": edit_settings,
+    }
+)
+# endregion
+# ---------------------------------------------------------
@@ -1,5 +1,7 @@
+from functools import lru_cache
 from typing import List
 
+from aiogram.filters.callback_data import CallbackData
 from aiogram.types import (
     ReplyKeyboardMarkup,
     KeyboardButton,
@@ -9,6 +11,31 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from src.database.models import Event
 
+
+class RegisterEventCallback(CallbackData, prefix="register", sep="_"):
+    """Выбор мероприятия для регистрации: register_<event_id>"""
+
+    event_id: int
+
+
+class EventCallback(CallbackData, prefix="event", sep="_"):
+    """Выбор мероприятия в админ-командах: event_<event_id>"""
+
+    event_id: int
+
+
+class ConfirmRegistrationCallback(CallbackData, prefix="confirm_yes"):
+    """Подтверждение регистрации: confirm_yes:<event_id>"""
+
+    event_id: int
+
+
+class CancelEventCallback(CallbackData, prefix="cancel_confirm"):
+    """Подтверждение отмены мероприятия: cancel_confirm:<event_id>"""
+
+    event_id: int
+
+
 admin_keyboard = ReplyKeyboardMarkup(
     keyboard=[[KeyboardButton(text="Команды")]], resize_keyboard=True
 )
@@ -78,30 +105,50 @@ def create_time_keyboard(
     return create_inline_kb(buttons, buttons_per_row)
 
 
-def active_events_kb(events: List[Event]):
+@lru_cache(maxsize=4)
+def _build_active_events_kb(events_fp: tuple[tuple[int, str], ...]):
     return create_inline_kb(
-        [(event.name, f"register_{event.id}") for event in events], adjust=1
+        [
+            (name, RegisterEventCallback(event_id=event_id).pack())
+            for event_id, name in events_fp
+        ],
+        adjust=1,
     )
 
 
+def active_events_kb(events: List[Event]):
+    # Клавиатура пересобирается только при изменении состава или названий мероприятий
+    return _build_active_events_kb(tuple((event.id, event.name) for event in events))
+
+
 def get_registration_kb(event_id):
-    return create_inline_kb([("Зарегистрироваться", f"register_{event_id}")])
+    return create_inline_kb(
+        [("Зарегистрироваться", RegisterEventCallback(event_id=event_id).pack())]
+    )
 
 
-def get_events_kb(events):
+@lru_cache(maxsize=4)
+def _build_events_kb(events_fp: tuple[tuple[int, str], ...]):
     return create_inline_kb(
-        [(event.name, f"event_{event.id}") for event in events], adjust=1
+        [(name, EventCallback(event_id=event_id).pack()) for event_id, name in events_fp],
+        adjust=1,
     )
 
 
+def get_events_kb(events):
+    # Как и active_events_kb: кэш по составу и названиям мероприятий
+    return _build_events_kb(tuple((event.id, event.name) for event in events))
+
+
 def get_confirm_kb():
     return create_inline_kb([("✅ Подтвердить", "confirm"), ("❌ Отменить", "cancel")])
 
 
+@lru_cache(maxsize=32)
 def get_cancel_confirmation_kb(event_id):
     return create_inline_kb(
         [
-            ("✅ Подтвердить", f"cancel_confirm_{event_id}"),
+            ("✅ Подтвердить", CancelEventCallback(event_id=event_id).pack()),
             ("❌ Отмена", "cancel_reject"),
         ]
     )
@@ -120,7 +167,7 @@ def get_broadcast_confirmation_kb():
 def get_registration_confirmation_kb(event_id):
     return create_inline_kb(
         [
-            ("✅ Да", f"confirm_yes_{event_id}"),
+            ("✅ Да", ConfirmRegistrationCallback(event_id=event_id).pack()),
             ("❌ Нет", "confirm_no"),
         ]
     )
@@ -1,17 +1,35 @@
 from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
 from sqlalchemy import select
 
 from src.config.config import settings
 from src.config.logger_config import logger
-from src.database.database import init_db, get_db
+from src.database.database import init_db, get_db, warm_up_pool
 from src.database.models import SystemSetting
 from src.handlers.main_handlers import router as main_router
 from src.handlers.service_handlers import router as service_router
-from src.middleware.middleware import AdminCallbackMiddleware
-from src.utils.scheduler import setup_scheduler
+from src.middleware.middleware import AdminCallbackMiddleware, DbConcurrencyMiddleware
+from src.utils.scheduler import setup_scheduler, recover_notification_queue
 
 bot = Bot(token=settings.BOT_TOKEN)
-dp = Dispatcher()
+
+
+def create_fsm_storage() -> BaseStorage:
+    """RedisStorage, если задан REDIS_URL, иначе хранение состояний в памяти процесса"""
+    if not settings.REDIS_URL:
+        return MemoryStorage()
+    from aiogram.fsm.storage.redis import DefaultKeyBuilder, RedisStorage
+
+    return RedisStorage.from_url(
+        settings.REDIS_URL,
+        key_builder=DefaultKeyBuilder(with_bot_id=True),
+        state_ttl=settings.FSM_TTL,
+        data_ttl=settings.FSM_TTL,
+    )
+
+
+dp = Dispatcher(storage=create_fsm_storage())
 
 
 async def init_system_settings():
@@ -73,10 +91,16 @@ async def init_system_settings():
 async def main():
     """Запуск бота"""
     await init_db()
+    await warm_up_pool()
+    await recover_notification_queue()
     await init_system_settings()
 
     dp.update.middleware.register(AdminCallbackMiddleware())
     dp.callback_query.middleware(AdminCallbackMiddleware())
+    # Обработчик держит не больше двух сессий: лимит DB_POOL_SIZE укладывается в пул с переполнением
+    db_concurrency = DbConcurrencyMiddleware(settings.database.DB_POOL_SIZE)
+    dp.message.middleware(db_concurrency)
+    dp.callback_query.middleware(db_concurrency)
 
     dp.include_router(main_router)
     dp.include_router(service_router)
@@ -91,6 +115,7 @@ async def main():
         logger.error(f"Ошибка в работе бота: {e}")
     finally:
         logger.info("Остановка бота...")
+        await dp.storage.close()
         await logger.complete()  # Дождаться записи всех логов
 
 
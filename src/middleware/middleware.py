@@ -15,17 +15,6 @@ def log_user_action(user_id: int, action: str, his: bool = False):
     logger.info(f"{"Пользователь" if not his else "Пользователю"}  {user_id} {action}")
 
 
-async def async_log_user_action(user_id: int, action: str, his: bool = False):
-    await asyncio.to_thread(
-        log_user_action,
-        user_id,
-        action,
-        his=his,
-    )
-
-
-
-
 # ---------------------------------------------------------
 # region AdminCallbackMiddleware
 # ---------------------------------------------------------
@@ -39,7 +28,7 @@ class AdminCallbackMiddleware(BaseMiddleware):
                 and event.data.startswith("command_")
         ):
             user_id = event.from_user.id
-            async with get_db() as session:
+            async with get_db(readonly=True) as session:
                 is_admin = await check_admin_cached(session, user_id)
                 if not is_admin:
                     logger.warning(
@@ -48,7 +37,7 @@ class AdminCallbackMiddleware(BaseMiddleware):
                     await event.answer("🚫 Доступ запрещен.", show_alert=True)
                     return  # Не продолжаем обработку
 
-                await async_log_user_action(
+                log_user_action(
                     event.from_user.id,
                     f"начал выполнение админ-команды {event.data}. 🔐 Запрошен пароль администратора.",
                     his=False,
@@ -58,6 +47,8 @@ class AdminCallbackMiddleware(BaseMiddleware):
                 state: FSMContext = data["state"]
                 await state.update_data(
                     original_callback=event.data,
+                    # Имя команды без префикса: после ввода пароля - сразу ключ CALLBACK_COMMANDS
+                    pending_command=event.data.removeprefix("command_"),
                     # Сохраняем данные, необходимые для воссоздания CallbackQuery
                     callback_chat_id=event.message.chat.id,
                     callback_message_id=event.message.message_id,
@@ -77,3 +68,23 @@ class AdminCallbackMiddleware(BaseMiddleware):
 
 # endregion
 # ---------------------------------------------------------
+
+
+# ---------------------------------------------------------
+# region DbConcurrencyMiddleware
+# ---------------------------------------------------------
+
+class DbConcurrencyMiddleware(BaseMiddleware):
+    """Ограничивает число одновременно выполняемых обработчиков размером пула БД"""
+
+    def __init__(self, limit: int):
+        self.semaphore = asyncio.Semaphore(limit)
+
+    async def __call__(self, handler, event: TelegramObject, data):
+        # Лишние обновления ждут своей очереди, а не соединения из пула
+        async with self.semaphore:
+            return await handler(event, data)
+
+
+# endregion
+# ---------------------------------------------------------
@@ -1,5 +1,6 @@
 import asyncio
 
+from src.config.config import settings
 from src.database.database import get_db
 from src.database.models import User
 
@@ -15,4 +16,5 @@ async def main():
 
 
 if __name__ == "__main__":
+    settings.database.DB_POOL = "null"
     asyncio.run(main())
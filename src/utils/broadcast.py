@@ -0,0 +1,88 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Iterable
+
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+
+from src.config.logger_config import logger
+
+BROADCAST_RATE = 30  # глобальный лимит Telegram: ~30 сообщений в секунду
+MAX_SEND_ATTEMPTS = 3  # попыток отправки одному пользователю при TelegramRetryAfter
+
+
+class TokenBucket:
+    """Ограничитель частоты: не больше rate операций в секунду"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.last_refill = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.rate, self.tokens + (now - self.last_refill) * self.rate
+                )
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# Лимит Telegram общий для всего бота, поэтому ограничитель один на процесс
+broadcast_limiter = TokenBucket(BROADCAST_RATE)
+
+
+async def send_with_retry(send: Callable[[], Awaitable], chat_id: int) -> bool:
+    """Отправляет сообщение с учётом лимита, при TelegramRetryAfter ждёт и повторяет"""
+    for _ in range(MAX_SEND_ATTEMPTS):
+        await broadcast_limiter.acquire()
+        try:
+            await send()
+            return True
+        except TelegramRetryAfter as e:
+            logger.warning(
+                f"Превышен лимит Telegram при отправке {chat_id}, повтор через {e.retry_after} с"
+            )
+            await asyncio.sleep(e.retry_after)
+        except TelegramAPIError as e:
+            logger.error(f"Ошибка отправки сообщения пользователю {chat_id}: {e}")
+            return False
+    logger.error(f"Сообщение пользователю {chat_id} не отправлено: исчерпаны попытки")
+    return False
+
+
+async def broadcast_to_users(
+    user_ids: Iterable[int],
+    send: Callable[[int], Awaitable],
+    concurrency: int = BROADCAST_RATE,
+) -> tuple[int, int]:
+    """
+    Параллельная рассылка: send(user_id) вызывается для каждого пользователя.
+
+    Returns:
+        (успешно, ошибки)
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send_one(user_id: int) -> bool:
+        async with semaphore:
+            return await send_with_retry(lambda: send(user_id), user_id)
+
+    user_ids = list(user_ids)
+    results = await asyncio.gather(
+        *(send_one(user_id) for user_id in user_ids), return_exceptions=True
+    )
+    # Ошибки Telegram уже записаны в send_with_retry, здесь - только неожиданные
+    for user_id, result in zip(user_ids, results):
+        if isinstance(result, BaseException):
+            logger.opt(exception=result).error(
+                f"Непредвиденная ошибка при рассылке пользователю {user_id}"
+            )
+    success = sum(result is True for result in results)
+    return success, len(results) - success
+
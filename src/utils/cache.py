@@ -1,11 +1,97 @@
+import asyncio
+from functools import wraps
+
 from cachetools import TTLCache
+from cachetools.keys import hashkey
 
-# кэш на 10 минут
-events_cache = TTLCache(maxsize=1024, ttl=600)
+# кэш на 1 минуту: TTL страхует от пропущенной инвалидации
+events_cache = TTLCache(maxsize=1024, ttl=60)
 
 # кэш на 3 минуты
 system_cache = TTLCache(maxsize=512, ttl=180)
 
+# кэш системных настроек на 5 минут: меняются редко и сбрасываются при set_setting
+settings_cache = TTLCache(maxsize=16, ttl=300)
+
+# кэш результатов проверки паролей на 5 минут
+password_cache = TTLCache(maxsize=1024, ttl=300)
+
+# Индекс тегов: тег (ID события) -> ключи events_cache, которые нужно сбросить вместе с ним
+cache_tags: dict = {}
+
+# Маркер промаха: None - допустимый результат (например, мероприятие не найдено)
+_MISSING = object()
+
+# Тег для списка активных мероприятий: сбрасывается при любом изменении мероприятия
+ACTIVE_EVENTS_TAG = "__all_active__"
+
+
+def register_tag(cache, tag, key):
+    """
+    Регистрирует ключ кэша под тегом.
+
+    TTLCache удаляет истёкшие и вытесненные ключи молча, поэтому индекс
+    вычищается здесь: ключи тега - при каждой регистрации, а теги целиком -
+    когда их становится больше, чем может храниться ключей в кэше.
+    """
+    if len(cache_tags) > cache.maxsize:
+        for stale_tag, keys in list(cache_tags.items()):
+            keys.intersection_update([k for k in keys if k in cache])
+            if not keys:
+                del cache_tags[stale_tag]
+
+    keys = cache_tags.setdefault(tag, set())
+    keys.difference_update([k for k in keys if k not in cache])
+    keys.add(key)
+
+
+def async_cached(cache, tag=None):
+    """
+    Кэширует результат корутины (а не объект корутины, как cachetools.cached).
+
+    Первый аргумент (сессия БД) в ключ не входит. Пока запрос выполняется,
+    в кэше лежит Future, поэтому параллельные промахи по одному ключу
+    дожидаются одного обращения к базе.
+
+    Args:
+        cache: кэш для хранения результатов.
+        tag: функция, получающая аргументы вызова (без сессии) и возвращающая тег,
+            под которым ключ регистрируется в cache_tags для точечной очистки.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(session, *args):
+            key = hashkey(func.__name__, *args)
+            value = cache.get(key, _MISSING)
+            if value is not _MISSING:
+                return await value if asyncio.isfuture(value) else value
+
+            future = asyncio.get_running_loop().create_future()
+            cache[key] = future
+            if tag is not None:
+                register_tag(cache, tag(*args), key)
+            try:
+                result = await func(session, *args)
+            except BaseException as e:
+                # В том числе CancelledError: иначе ожидающие зависнут на Future до истечения TTL
+                if cache.get(key) is future:
+                    cache.pop(key, None)
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+                    future.exception()  # помечаем исключение как полученное
+                raise
+            if cache.get(key) is future:
+                cache[key] = result
+            future.set_result(result)
+            return result
+
+        return wrapper
+
+    return decorator
+
 
 def clear_event_cache(event_id=None):
     """
@@ -16,14 +102,10 @@ def clear_event_cache(event_id=None):
     """
     if event_id is None:
         events_cache.clear()
+        cache_tags.clear()
         return
 
-    keys_to_remove = []
-    for key in list(events_cache.keys()):
-        # Проверяем, является ли ключ кортежем и содержит ли он наш event_id
-        if isinstance(key, tuple) and any(str(event_id) in str(k) for k in key):
-            keys_to_remove.append(key)
-
-    for key in keys_to_remove:
-        if key in events_cache:
-            del events_cache[key]
+    # Теги событий — целые ID, поэтому очистка сводится к поиску в словаре
+    for tag in (int(event_id), ACTIVE_EVENTS_TAG):
+        for key in cache_tags.pop(tag, ()):
+            events_cache.pop(key, None)
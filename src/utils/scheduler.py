@@ -1,15 +1,20 @@
 from asyncio import Semaphore, gather
 from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Optional
 
 from aiogram import Bot
 from aiogram.exceptions import TelegramAPIError
+from aiogram.types import InlineKeyboardMarkup
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
 
 from src.config.logger_config import logger
 from src.database.database import get_db
-from src.database.models import User, Event, Registration, BroadcastQueue
+from src.database.models import User, Event, Registration, BroadcastQueue, NotificationQueue, clear_event_from_cache
 from src.keyboards.keyboards import get_registration_kb
+from src.utils.broadcast import BROADCAST_RATE, broadcast_to_users, send_with_retry
 
 MAX_CONCURRENT_TASKS = 20  # ограничение на число одновременных отправок
 
@@ -94,9 +99,12 @@ async def should_send_reminder(event: Event, reminder_type: str) -> bool:
 
 
 async def mark_reminder_sent(session, event: Event, reminder_type: str):
-    """Отмечает напоминание как отправленное и фиксирует изменения в БД"""
-    setattr(event, reminder_type, True)
-    await session.commit()
+    """Отмечает напоминание как отправленное одним UPDATE флага"""
+    if await Event.update_reminder(
+        session, event.id, reminder_type.removeprefix("reminder_")
+    ):
+        # Загруженный объект синхронизируется без пометки "изменён": повторного UPDATE не будет
+        set_committed_value(event, reminder_type, True)
 
 
 def russian_plural(n: int, variants: tuple[str, str, str]) -> str:
@@ -169,6 +177,7 @@ async def check_events(bot: Bot):
                 event.status = "completed"
                 await notify_admins(bot, event)
                 await session.commit()
+                clear_event_from_cache(event.id)
                 logger.info(f"Событие '{event.name}' отмечено завершенным.")
 
 
@@ -188,6 +197,28 @@ async def get_pending_data_for_single_broadcast():
 
 
 
+# Метод Bot и имя параметра с file_id для каждого типа медиа в очереди рассылки
+MEDIA_SENDERS = {
+    "photo": ("send_photo", "photo"),
+    "voice": ("send_voice", "voice"),
+    "video": ("send_video", "video"),
+    "video_note": ("send_video_note", "video_note"),
+}
+
+
+def build_broadcast_sender(bot: Bot, message: BroadcastQueue):
+    """Собирает отправку сообщения очереди одному пользователю: параметры готовятся один раз"""
+    if message.media_type not in MEDIA_SENDERS:
+        return lambda user_id: bot.send_message(user_id, message.text, parse_mode="HTML")
+
+    method_name, media_arg = MEDIA_SENDERS[message.media_type]
+    send = getattr(bot, method_name)
+    kwargs = {media_arg: message.media_id}
+    if message.media_type != "video_note":  # кружочки не поддерживают подписи
+        kwargs.update(caption=message.text or "", parse_mode="HTML")
+    return lambda user_id: send(user_id, **kwargs)
+
+
 async def process_single_broadcast_message(bot: Bot):
     """Отправляет одно сообщение всем пользователям"""
     logger.info(f"Запуск единичной рассылки сообщений")
@@ -198,57 +229,83 @@ async def process_single_broadcast_message(bot: Bot):
             logger.info("Очередь рассылки пуста, отправлять ничего не нужно.")
             return
 
-        async with get_db() as session:
-            success, errors = 0, 0
-            semaphore = Semaphore(MAX_CONCURRENT_TASKS)
-
-            async def send_to_user(user_id):
-                nonlocal success, errors
-                async with semaphore:
-                    try:
-                        if message.media_type == "photo":
-                            await bot.send_photo(
-                                user_id,
-                                message.media_id,
-                                caption=message.text or "",
-                                parse_mode="HTML"
-                            )
-                        elif message.media_type == "voice":
-                            await bot.send_voice(
-                                user_id,
-                                message.media_id,
-                                caption=message.text or "",
-                                parse_mode="HTML"
-                            )
-                        elif message.media_type == "video_note":
-                            await bot.send_video_note(user_id, message.media_id)
-                        elif message.media_type == "video":
-                            await bot.send_video(
-                                user_id,
-                                message.media_id,
-                                caption=message.text or "",
-                                parse_mode="HTML"
-                            )
-                        else:
-                            await bot.send_message(user_id, message.text, parse_mode="HTML")
-
-                        success += 1
-                    except (TelegramAPIError, Exception) as exception:
-                        errors += 1
-                        logger.error(f"Ошибка отправки сообщения пользователю {user_id}: {exception}")
-
-            tasks = [send_to_user(user_id) for user_id in users]
-            await gather(*tasks)
+        # Общий лимит частоты и повтор при TelegramRetryAfter - в broadcast_to_users
+        success, errors = await broadcast_to_users(users, build_broadcast_sender(bot, message))
 
+        async with get_db() as session:
             # Отмечаем сообщение как отправленное
             await BroadcastQueue.mark_as_sent(session, message.id)
 
-            logger.info(f"Рассылка сообщения ID {message.id} завершена: успешно - {success}, ошибки - {errors}")
+        logger.info(f"Рассылка сообщения ID {message.id} завершена: успешно - {success}, ошибки - {errors}")
 
     except Exception as e:
         logger.exception(f"Ошибка при единичной рассылке: {e}")
 
 
+@lru_cache(maxsize=16)
+def markup_from_json(reply_markup: Optional[str]) -> Optional[InlineKeyboardMarkup]:
+    """Клавиатура рассылки разбирается из JSON один раз, а не для каждого получателя"""
+    return InlineKeyboardMarkup.model_validate_json(reply_markup) if reply_markup else None
+
+
+async def recover_notification_queue():
+    """Возвращает в очередь уведомления, отправка которых прервалась при остановке бота"""
+    async with get_db() as session:
+        restored = await NotificationQueue.requeue_unfinished(session)
+    if restored:
+        logger.info(f"В очередь уведомлений возвращено неотправленных сообщений: {restored}")
+
+
+async def process_notification_queue(bot: Bot):
+    """Разбирает очередь персональных уведомлений пачками по BROADCAST_RATE сообщений"""
+    try:
+        # Курсор по id: вернувшиеся в очередь после ошибки уведомления повторяются в следующий запуск
+        last_id = 0
+        while True:
+            async with get_db() as session:
+                batch = await NotificationQueue.claim_pending(session, BROADCAST_RATE, last_id)
+            if not batch:
+                return
+            last_id = batch[-1].id
+
+            # Сессия закрыта до обращений к Telegram: соединение не держится на время отправки
+            results = await gather(
+                *(
+                    send_with_retry(
+                        lambda item=item: bot.send_message(
+                            item.user_id,
+                            item.text,
+                            parse_mode="HTML",
+                            reply_markup=markup_from_json(item.reply_markup),
+                        ),
+                        item.user_id,
+                    )
+                    for item in batch
+                ),
+                return_exceptions=True,
+            )
+            # Неожиданная ошибка одной отправки не должна оставить пачку в статусе "sending"
+            for item, result in zip(batch, results):
+                if isinstance(result, BaseException):
+                    logger.opt(exception=result).error(
+                        f"Ошибка отправки уведомления {item.id} пользователю {item.user_id}"
+                    )
+            delivered = [result is True for result in results]
+
+            async with get_db() as session:
+                await NotificationQueue.complete_batch(
+                    session,
+                    sent_ids=[item.id for item, sent in zip(batch, delivered) if sent],
+                    failed_ids=[item.id for item, sent in zip(batch, delivered) if not sent],
+                )
+
+            success = sum(delivered)
+            logger.info(
+                f"Пачка уведомлений обработана: успешно - {success}, ошибки - {len(delivered) - success}"
+            )
+    except Exception as e:
+        logger.exception(f"Ошибка при обработке очереди уведомлений: {e}")
+
 
 def setup_scheduler(bot: Bot):
     scheduler = AsyncIOScheduler()
@@ -259,6 +316,15 @@ def setup_scheduler(bot: Bot):
         args=[bot],
         next_run_time=datetime.now() + timedelta(seconds=10),
     )
+    # Персональные уведомления разбираются почти сразу после постановки в очередь
+    scheduler.add_job(
+        process_notification_queue,
+        "interval",
+        seconds=5,
+        args=[bot],
+        max_instances=1,
+        coalesce=True,
+    )
     # Новое расписание для очереди рассылки
     scheduler.add_job(
         process_single_broadcast_message,
@@ -0,0 +1,29 @@
+import time
+
+from passlib.context import CryptContext
+
+TARGET_SECONDS = 0.5  # допустимое время одной проверки пароля
+MIN_ROUNDS = 10
+MAX_ROUNDS = 16
+
+
+def measure(rounds: int) -> float:
+    context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds)
+    start = time.perf_counter()
+    context.hash("benchmark")
+    return time.perf_counter() - start
+
+
+def main():
+    best = MIN_ROUNDS
+    for rounds in range(MIN_ROUNDS, MAX_ROUNDS + 1):
+        elapsed = measure(rounds)
+        print(f"rounds={rounds}: {elapsed * 1000:.0f} мс")
+        if elapsed > TARGET_SECONDS:
+            break
+        best = rounds
+    print(f"Рекомендуемое значение BCRYPT_ROUNDS={best}")
+
+
+if __name__ == "__main__":
+    main()